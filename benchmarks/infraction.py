@@ -0,0 +1,89 @@
+"""
+Micro-benchmark of the Infraction model
+Copyright (C) 2021-present ItsArtemiz (Augadh Verma)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+
+Measures how many Infraction objects can be built per second and how many
+bytes each one keeps alive, both for a counting loop which only reads the
+stored fields and for a listing loop which also reads the derived ones.
+
+Run it from the repository root:
+    python benchmarks/infraction.py [count]
+"""
+
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from bson import ObjectId
+from utils.models import Infraction, InfractionType
+
+def documents(count: int) -> list[dict]:
+    types = [t.value for t in InfractionType]
+    now = time.time()
+    return [
+        {
+            '_id':ObjectId(),
+            'id':i,
+            'moderator':449897807936225290,
+            'offender':100000000000000000 + i,
+            'reason':f'Reason number {i}',
+            'type':types[i % len(types)],
+            'deleted':i % 10 == 0,
+            'until':now + 86400 * (i % 30),
+            'guild_id':576325772629901312
+        }
+        for i in range(count)
+    ]
+
+def counting(docs: list[dict]) -> list[Infraction]:
+    infractions = [Infraction(d) for d in docs]
+    sum(1 for i in infractions if not i.deleted)
+    return infractions
+
+def listing(docs: list[dict]) -> list[Infraction]:
+    infractions = [Infraction(d) for d in docs]
+    for i in infractions:
+        i.case, i.created, i.until, i.colour
+    return infractions
+
+def bench(name: str, func, docs: list[dict], repeat: int = 5) -> None:
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(docs)
+        best = min(best, time.perf_counter() - start)
+
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    kept = func(docs)
+    after = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+
+    per_object = (after - before) / len(kept)
+    print(f'{name:<10} {len(docs) / best:>14,.0f} objects/s {per_object:>10,.0f} bytes/object')
+
+def main() -> None:
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    docs = documents(count)
+    print(f'{count:,} infractions')
+    bench('counting', counting, docs)
+    bench('listing', listing, docs)
+
+if __name__ == '__main__':
+    main()
@@ -16,15 +16,18 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
+import asyncio
 import discord
 import datetime
 import re
+import time
 
 from discord.ext import commands
 from discord import app_commands
-from utils import EmbedPages, Embed, Context, has_setting_role, is_mod, Cache
+from bson import ObjectId
+from utils import EmbedPages, Embed, Context, is_mod, Cache, LRUCache, ActionState, StageOrder, get_state, CursorPages, CursorPageSource
 
-from typing import Any, Callable, Literal, Union, Optional, TypedDict
+from typing import Any, Awaitable, Callable, Literal, Union, Optional, TypedDict
 from collections import Counter
 
 from utils import Bot, Infraction, InfractionType, ReasonError
@@ -35,6 +38,19 @@ REASON = 'The reason for the infraction.'
 HIERARCY_ERROR_MESSAGE = 'You cannot do this action on this user due to role hierarchy.'
 SEARCH = 'The number of messages to search.'
 
+STATS_CACHE_TTL = 300 # seconds the /modstats results are reused for
+STATS_CACHE_SIZE = 256 # /modstats results kept, least recently used dropped first
+STATS_FIELD_LINES = 10 # moderators listed per week by /modstats moderators
+AUTO_TYPES = [InfractionType.autowarn.value, InfractionType.automute.value, InfractionType.autotimeout.value]
+DAYS = 'The number of past days to include.'
+MASS_ACTION_LIMIT = 200 # users per mass action
+MASS_ACTION_CONCURRENCY = 5 # discord requests a mass action runs at once
+USERS = 'The IDs or mentions of the users, separated by spaces.'
+USER_ID_REGEX = re.compile(r'\d{15,20}')
+
+# the fields an infraction page shows
+INFRACTION_PROJECTION = {'id':1, 'moderator':1, 'offender':1, 'reason':1, 'type':1, 'deleted':1, 'until':1, 'guild_id':1}
+
 def get_until(**kwargs) -> float:
     """Gets the future timestamp.
 
@@ -47,6 +63,11 @@ def get_until(**kwargs) -> float:
     """
     return discord.utils.utcnow().timestamp() + datetime.timedelta(**kwargs).total_seconds()
 
+def created_since(days: int) -> dict[str, ObjectId]:
+    """A filter on ``_id`` matching the documents created in the last days."""
+    since = discord.utils.utcnow() - datetime.timedelta(days=days)
+    return {'$gte':ObjectId.from_datetime(since)}
+
 def can_execute_action(interaction: discord.Interaction, moderator: discord.Member, offender: discord.Member) -> bool:
     return (
         moderator.id == interaction.client.owner_id or 
@@ -54,6 +75,20 @@ def can_execute_action(interaction: discord.Interaction, moderator: discord.Memb
         moderator.top_role > offender.top_role if isinstance(offender, discord.Member) else True
     )
 
+def action_label(type: InfractionType) -> str:
+    """The name of an infraction type to show to users."""
+    if type is InfractionType.timout:
+        return 'timeout'
+    return type.name
+
+# the infraction types /warns filters by, under the names shown to users
+INFRACTION_TYPE = Literal['autowarn', 'automute', 'warn', 'mute', 'kick', 'softban', 'ban', 'unban', 'autotimeout', 'timeout']
+INFRACTION_TYPES = {action_label(t): t for t in InfractionType}
+
+def parse_user_ids(value: str) -> list[int]:
+    """The unique user IDs in a string of IDs or mentions, in order."""
+    return list(dict.fromkeys(int(m) for m in USER_ID_REGEX.findall(value)))
+
 class ActionReason(TypedDict):
     original_reason: str
     reason: str
@@ -67,21 +102,42 @@ class ReasonTransformer(app_commands.Transformer):
             raise ReasonError(f"Reason is too long ({len(value)}/{len(reason_max)})")
         return ActionReason(original_reason=value, reason=reason)
 
-class InfractionPageEntry:
-    def __init__(self, infraction: Infraction) -> None:
-        title = f"{infraction.case} | {infraction.created.strftime('%Y-%m-%d')}"
-        description = infraction.embed_description('log')
-        self.field = (title, description)
+class InfractionPageSource(CursorPageSource):
+    """Shows the infractions of a page as embed fields, newest first."""
+
+    def __init__(self, bot: Bot, filter: dict, *, total: int, per_page: int = 5) -> None:
+        super().__init__(
+            bot.infractions,
+            filter,
+            total=total,
+            projection=INFRACTION_PROJECTION,
+            sort=[('_id', -1)],
+            per_page=per_page
+        )
+
+    async def format_page(self, menu, entries):
+        menu.embed.clear_fields()
+        for document in entries:
+            infraction = Infraction(document)
+            title = f"{infraction.case} | {infraction.created.strftime('%Y-%m-%d')}"
+            menu.embed.add_field(name=title, value=infraction.embed_description('log'), inline=False)
 
-class InfractionPages(EmbedPages):
-    def __init__(self, entries: list[Infraction], *, interaction: discord.Interaction, bot: Bot, per_page=5, **kwargs) -> None:
-        converted = [InfractionPageEntry(entry).field for entry in entries]
-        super().__init__(converted, per_page=per_page, interaction=interaction, bot=bot, **kwargs)
+        maximum = self.get_max_pages()
+        if maximum > 1:
+            menu.embed.set_footer(text=f'Page {menu.current_page + 1}/{maximum} ({self.total} entries)')
+
+        return menu.embed
+
+class InfractionPages(CursorPages):
+    def __init__(self, bot: Bot, filter: dict, *, total: int, interaction: discord.Interaction, per_page=5, **kwargs) -> None:
+        super().__init__(InfractionPageSource(bot, filter, total=total, per_page=per_page), interaction=interaction, bot=bot, **kwargs)
 
 class Moderation(commands.Cog):
     def __init__(self, bot: Bot) -> None:
         self.bot = bot
         self.last_auto_timeout_user_id = Cache(seconds=60)
+        # (statistic, guild id, days) -> (aggregation results, monotonic time computed)
+        self.stats_cache = LRUCache(STATS_CACHE_SIZE)
 
     async def post_infraction_log(
         self,
@@ -93,8 +149,8 @@ class Moderation(commands.Cog):
         # suppress warnings in channels like testimonials
         try:
             if settings.suppress_warns:
-                current = [ctx.channel.id, ctx.channel.category_id]
-                if any(x in current for x in settings.suppress_warns):
+                current = (ctx.channel.id, ctx.channel.category_id)
+                if not settings.suppress_warns.isdisjoint(current):
                     pass
                 else:
                     await ctx.send(embed=infraction.embed('channel'))
@@ -120,18 +176,11 @@ class Moderation(commands.Cog):
         offender: Union[discord.Member, discord.User],
         infraction: Infraction
     ):
-        if isinstance(action, discord.Interaction):
-            ctx = await self.bot.get_context(action, cls=Context)
-        else:
-            ctx = action
+        ctx = (await get_state(action)).ctx
 
         log = await self.post_infraction_log(ctx, offender, infraction)
 
-        count = 0
-        async for document in self.bot.infractions.find({'guild_id':ctx.guild.id, 'offender':offender.id}):
-            inf = Infraction(document)
-            if not inf.deleted:
-                count += 1
+        count = await self.bot.get_active_infraction_count(ctx.guild.id, offender.id)
 
         if count >= 3:
             if self.last_auto_timeout_user_id.get(ctx.guild.id) == offender.id:
@@ -162,13 +211,10 @@ class Moderation(commands.Cog):
     @app_commands.command(name="info", description="Shows information about an infraction.")
     @app_commands.describe(id="The id of the infraction.", show_deleted=SHOW_DELETED_DESCRIPTION)
     async def info(self, interaction: discord.Interaction, id: int, show_deleted: Optional[SHOW_DELETED]) -> None:
-        infraction = await self.bot.get_infraction(id, interaction.guild_id)
+        infraction = await self.bot.get_infraction(id, interaction.guild_id, include_deleted=show_deleted != 'No')
         if infraction is None:
             return await interaction.response.send_message(f"The infraction #{id} does not exist.")
-        else:
-            if infraction.deleted and show_deleted == 'No':
-                return await interaction.response.send_message(f"The infraction #{id} does not exist.")
-            return await interaction.response.send_message(embed=infraction.embed('log'))
+        return await interaction.response.send_message(embed=infraction.embed('log'))
 
     @is_mod()
     @app_commands.command(name="warn", description="Warns a user")
@@ -279,6 +325,144 @@ class Moderation(commands.Cog):
 
         await self.on_infraction(interaction, user, infraction)
 
+    async def mass_action(
+        self,
+        interaction: discord.Interaction,
+        users: str,
+        type: InfractionType,
+        until: float,
+        reason: ActionReason,
+        action: Callable[[int], Awaitable[Any]]
+    ) -> None:
+        """Runs an action on many users, then records and logs them all at once.
+
+        The action receives a user id and raises to report a failure. At most
+        MASS_ACTION_CONCURRENCY actions run at the same time, discord.py waits
+        out the rate limits they hit.
+        """
+        label = action_label(type)
+        ids = parse_user_ids(users)
+        if not ids:
+            return await interaction.response.send_message("No user IDs were given.", ephemeral=True)
+        if len(ids) > MASS_ACTION_LIMIT:
+            return await interaction.response.send_message(f"At most {MASS_ACTION_LIMIT} users can be given at once.", ephemeral=True)
+
+        await interaction.response.defer()
+
+        semaphore = asyncio.Semaphore(MASS_ACTION_CONCURRENCY)
+        async def run(id: int) -> Optional[str]:
+            async with semaphore:
+                try:
+                    await action(id)
+                except Exception as e:
+                    return str(e) or e.__class__.__name__
+
+        errors = await asyncio.gather(*(run(id) for id in ids))
+        done = [id for id, error in zip(ids, errors) if error is None]
+        failed = [(id, error) for id, error in zip(ids, errors) if error is not None]
+
+        infractions = await self.bot.insert_infractions(
+            done,
+            interaction.user.id,
+            reason["original_reason"],
+            type,
+            until,
+            interaction.guild_id
+        )
+
+        if infractions:
+            first = infractions[0]
+            embed = Embed(
+                colour=first.colour.value,
+                title=f"Mass {label} | {len(infractions)} users",
+                timestamp=first.created
+            )
+            embed.add_field(name="Moderator", value=f"<@{interaction.user.id}> (`{interaction.user.id}`)", inline=False)
+            embed.add_field(name="Reason", value=reason["original_reason"], inline=False)
+
+            lines = [f"Case #{i.id} | <@{i.offender}> (`{i.offender}`)" for i in infractions]
+            description = "\n".join(lines)
+            if len(description) > 4000:
+                description = description[:description.rfind("\n", 0, 4000)] + "\n..."
+            embed.description = description
+            embed.set_footer(text="Infractions issued at")
+
+            await self.bot.post_log(interaction.guild, 'infractions', embed=embed)
+
+        message = f"Successfully applied {label} to {len(done)}/{len(ids)} users."
+        if failed:
+            message += "\n**Failed:**\n" + "\n".join(f"`{id}` - {error}" for id, error in failed[:10])
+            if len(failed) > 10:
+                message += f"\n...and {len(failed) - 10} more"
+        await interaction.followup.send(message[:2000])
+
+    async def member_for_action(self, interaction: discord.Interaction, id: int) -> discord.Member:
+        member = interaction.guild.get_member(id) or await interaction.guild.fetch_member(id)
+        if can_execute_action(interaction, interaction.user, member) is False:
+            raise commands.BadArgument(HIERARCY_ERROR_MESSAGE)
+        return member
+
+    @is_mod(senior=True)
+    @app_commands.command(name="massban", description="Bans many users from the server.")
+    @app_commands.describe(users=USERS, reason=REASON)
+    async def mass_ban(
+        self,
+        interaction: discord.Interaction,
+        users: str,
+        delete_messages: Optional[Literal['Don\'t Delete Any', 'Previous 24 Hours', 'Previous 7 Days']],
+        reason: app_commands.Transform[ActionReason, ReasonTransformer]
+    ) -> None:
+        to_delete = 1
+
+        if delete_messages == "Don't Delete Any":
+            to_delete = 0
+        elif delete_messages == "Previous 24 Hours":
+            to_delete = 1
+        elif delete_messages == "Previous 7 Days":
+            to_delete = 7
+
+        async def ban(id: int) -> None:
+            # users who already left can be banned too
+            member = interaction.guild.get_member(id)
+            if member is not None and can_execute_action(interaction, interaction.user, member) is False:
+                raise commands.BadArgument(HIERARCY_ERROR_MESSAGE)
+            await interaction.guild.ban(discord.Object(id), reason=reason["reason"], delete_message_days=to_delete)
+
+        await self.mass_action(interaction, users, InfractionType.ban, get_until(days=10000), reason, ban)
+
+    @is_mod(senior=True)
+    @app_commands.command(name="masskick", description="Kicks many users from the server.")
+    @app_commands.describe(users=USERS, reason=REASON)
+    async def mass_kick(
+        self,
+        interaction: discord.Interaction,
+        users: str,
+        reason: app_commands.Transform[ActionReason, ReasonTransformer]
+    ) -> None:
+        async def kick(id: int) -> None:
+            member = await self.member_for_action(interaction, id)
+            await member.kick(reason=reason["reason"])
+
+        await self.mass_action(interaction, users, InfractionType.kick, get_until(days=30), reason, kick)
+
+    @is_mod(senior=True)
+    @app_commands.command(name="masstimeout", description="Times out many users.")
+    @app_commands.describe(users=USERS, minutes="How long the timeout lasts.", reason=REASON)
+    async def mass_timeout(
+        self,
+        interaction: discord.Interaction,
+        users: str,
+        minutes: app_commands.Range[int, 1, 40320],
+        reason: app_commands.Transform[ActionReason, ReasonTransformer]
+    ) -> None:
+        duration = datetime.timedelta(minutes=minutes)
+
+        async def timeout(id: int) -> None:
+            member = await self.member_for_action(interaction, id)
+            await member.timeout(duration, reason=reason["reason"])
+
+        await self.mass_action(interaction, users, InfractionType.timout, get_until(minutes=minutes), reason, timeout)
+
     @is_mod()
     @app_commands.command(name="removewarn", description="Removes an infraction.")
     @app_commands.describe(id="The id of the removal.")
@@ -287,7 +471,8 @@ class Moderation(commands.Cog):
         if infraction is None:
             return await interaction.response.send_message(f"Infraction with id #{id} does not exist.")
         
-        await self.bot.infractions.update_one({'_id':infraction._id}, {'$set':{'deleted':True}})
+        if not await self.bot.remove_infraction(infraction._id):
+            return await interaction.response.send_message(f"Infraction with id #{id} has already been removed.")
         
         await interaction.response.send_message(f"Successfully removed the infraction #{id}", embed=infraction.embed("log"))
 
@@ -361,7 +546,7 @@ class Moderation(commands.Cog):
         after: Optional[int] = None,
     ):
 
-        ctx = await self.bot.get_context(interaction, cls=Context)
+        ctx = (await get_state(interaction)).ctx
 
         if limit > 2000:
             return await interaction.response.send_message(f'Too many messages to search given ({limit}/2000)')
@@ -430,40 +615,170 @@ class Moderation(commands.Cog):
 
     @is_mod()
     @app_commands.command(name="warns", description="Shows warns received by/given to a user.")
-    @app_commands.describe(option="The option to show.", user="The user whose warns are being shown.", show_deleted=SHOW_DELETED_DESCRIPTION)
+    @app_commands.describe(
+        option="The option to show.",
+        user="The user whose warns are being shown.",
+        show_deleted=SHOW_DELETED_DESCRIPTION,
+        type="Only show infractions of this type.",
+        days="Only show infractions from the last given number of days."
+    )
     async def warns(
         self,
         interaction: discord.Interaction,
         option: Literal['Given by', 'Received by'],
         user: discord.User,
-        show_deleted: Optional[SHOW_DELETED]
+        show_deleted: Optional[SHOW_DELETED],
+        type: Optional[INFRACTION_TYPE],
+        days: Optional[app_commands.Range[int, 1, 3650]]
     ) -> None:
         if option == 'Given by':
             value='moderator'
         elif option == 'Received by':
             value='offender'
 
-        _all = []
-        async for document in self.bot.infractions.find({'guild_id':interaction.guild_id, value:user.id}):
-            infraction = Infraction(document)
-            if infraction.deleted and show_deleted == 'Yes':
-                _all.append(infraction)
-            else:
-                _all.append(infraction)
+        # the filters are applied by the database, only the shown page is fetched
+        filter: dict[str, Any] = {'guild_id':interaction.guild_id, value:user.id}
+        if show_deleted != 'Yes':
+            filter['deleted'] = False
+        if type is not None:
+            filter['type'] = INFRACTION_TYPES[type].value
+        if days is not None:
+            filter['_id'] = created_since(days)
+
+        total = await self.bot.infractions.count_documents(filter)
 
-        if _all:
+        if total:
             embed = Embed(
                 bot=self.bot,
-                title=f"{len(_all)} infractions found."
+                title=f"{total} infractions found."
             )
-            pages = InfractionPages(_all, interaction=interaction, bot=self.bot, embed=embed)
+            pages = InfractionPages(self.bot, filter, total=total, interaction=interaction, embed=embed)
             await pages.start()
         else:
             await interaction.response.send_message("No infractions found.")
 
-    @commands.Cog.listener('on_message')
-    async def detection(self, message: discord.Message) -> None:
-        if message.author.bot or message.guild is None:
+    modstats = app_commands.Group(name="modstats", description="Moderation statistics of the server.")
+
+    async def aggregate_stats(self, name: str, guild_id: int, days: int, pipeline: list[dict]) -> list[dict]:
+        """Runs an aggregation over the infractions, reusing the results for STATS_CACHE_TTL seconds."""
+        key = (name, guild_id, days)
+        cached = self.stats_cache.get(key)
+        if cached is not None:
+            results, computed = cached
+            if time.monotonic() - computed < STATS_CACHE_TTL:
+                return results
+            del self.stats_cache[key]
+
+        results = await self.bot.infractions.aggregate(pipeline).to_list(length=None)
+        self.stats_cache[key] = (results, time.monotonic())
+        return results
+
+    @is_mod()
+    @modstats.command(name="moderators", description="Infractions given by each moderator per week.")
+    @app_commands.describe(days=DAYS)
+    async def modstats_moderators(self, interaction: discord.Interaction, days: app_commands.Range[int, 1, 365] = 28) -> None:
+        created = {'$toDate':'$_id'}
+        weeks = await self.aggregate_stats('moderators', interaction.guild_id, days, [
+            {'$match':{'guild_id':interaction.guild_id, '_id':created_since(days), 'deleted':False}},
+            {'$group':{
+                '_id':{'year':{'$isoWeekYear':created}, 'week':{'$isoWeek':created}, 'moderator':'$moderator'},
+                'count':{'$sum':1}
+            }},
+            {'$sort':{'count':-1}},
+            {'$group':{
+                '_id':{'year':'$_id.year', 'week':'$_id.week'},
+                'total':{'$sum':'$count'},
+                'moderators':{'$push':{'moderator':'$_id.moderator', 'count':'$count'}}
+            }},
+            {'$sort':{'_id.year':-1, '_id.week':-1}}
+        ])
+
+        if not weeks:
+            return await interaction.response.send_message("No infractions found.")
+
+        entries = []
+        for week in weeks:
+            lines = [f"<@{m['moderator']}> - {m['count']}" for m in week['moderators'][:STATS_FIELD_LINES]]
+            if len(week['moderators']) > STATS_FIELD_LINES:
+                lines.append(f"...and {len(week['moderators']) - STATS_FIELD_LINES} more")
+            entries.append((f"{week['_id']['year']}-W{week['_id']['week']:02} ({week['total']} infractions)", "\n".join(lines)))
+
+        embed = Embed(bot=self.bot, title=f"Infractions per moderator in the last {days} days")
+        pages = EmbedPages(entries, interaction=interaction, bot=self.bot, per_page=4, embed=embed)
+        await pages.start()
+
+    @is_mod()
+    @modstats.command(name="auto", description="Automatic actions taken by the bot, by type.")
+    @app_commands.describe(days=DAYS)
+    async def modstats_auto(self, interaction: discord.Interaction, days: app_commands.Range[int, 1, 365] = 28) -> None:
+        types = await self.aggregate_stats('auto', interaction.guild_id, days, [
+            {'$match':{'guild_id':interaction.guild_id, '_id':created_since(days), 'type':{'$in':AUTO_TYPES}}},
+            {'$group':{
+                '_id':'$type',
+                'count':{'$sum':1},
+                'deleted':{'$sum':{'$cond':['$deleted', 1, 0]}},
+                'offenders':{'$addToSet':'$offender'}
+            }},
+            {'$project':{'count':1, 'deleted':1, 'offenders':{'$size':'$offenders'}}},
+            {'$sort':{'count':-1}}
+        ])
+
+        if not types:
+            return await interaction.response.send_message("No automatic actions found.")
+
+        entries = [
+            (
+                InfractionType(t['_id']).name.capitalize(),
+                f"**Actions:** {t['count']}\n**Users:** {t['offenders']}\n**Removed by moderators:** {t['deleted']}"
+            )
+            for t in types
+        ]
+
+        embed = Embed(bot=self.bot, title=f"Automatic actions in the last {days} days")
+        pages = EmbedPages(entries, interaction=interaction, bot=self.bot, per_page=6, embed=embed)
+        await pages.start()
+
+    @is_mod()
+    @modstats.command(name="offenders", description="The users with the most infractions.")
+    @app_commands.describe(days=DAYS, top="The number of users to show.")
+    async def modstats_offenders(
+        self,
+        interaction: discord.Interaction,
+        days: app_commands.Range[int, 1, 365] = 28,
+        top: app_commands.Range[int, 1, 100] = 25
+    ) -> None:
+        offenders = await self.aggregate_stats(f'offenders:{top}', interaction.guild_id, days, [
+            {'$match':{'guild_id':interaction.guild_id, '_id':created_since(days), 'deleted':False}},
+            {'$group':{'_id':'$offender', 'count':{'$sum':1}, 'last':{'$max':'$_id'}}},
+            {'$match':{'count':{'$gt':1}}},
+            {'$sort':{'count':-1, 'last':-1}},
+            {'$limit':top}
+        ])
+
+        if not offenders:
+            return await interaction.response.send_message("No repeat offenders found.")
+
+        entries = [
+            (
+                f"#{rank} | {o['count']} infractions",
+                f"<@{o['_id']}> (`{o['_id']}`)\n**Last:** {discord.utils.format_dt(o['last'].generation_time, 'R')}"
+            )
+            for rank, o in enumerate(offenders, start=1)
+        ]
+
+        embed = Embed(bot=self.bot, title=f"Repeat offenders in the last {days} days")
+        pages = EmbedPages(entries, interaction=interaction, bot=self.bot, per_page=10, embed=embed)
+        await pages.start()
+
+    async def cog_load(self) -> None:
+        self.bot.add_message_stage('detection', self.detection, order=StageOrder.detection)
+
+    async def cog_unload(self) -> None:
+        self.bot.remove_message_stage('detection')
+
+    async def detection(self, state: ActionState) -> Optional[bool]:
+        message = state.message
+        if message.guild is None:
             return
         if not message.channel.permissions_for(message.guild.me):
             return
@@ -471,14 +786,12 @@ class Moderation(commands.Cog):
         if message.author.guild_permissions.manage_messages:
             return
 
-        ctx = await self.bot.get_context(message, cls=Context)
+        ctx = state.ctx
 
-        if (await has_setting_role(ctx, 'bypass')):
+        if state.has_setting_role('bypass'):
             return
 
-        roles = [r.id for r in ctx.author.roles]
-
-        settings = await self.bot.get_guild_settings(message.guild.id)
+        settings = state.settings
 
         channel = message.channel
         exclusive = settings.detection_exclusive_channels
@@ -490,25 +803,23 @@ class Moderation(commands.Cog):
             thread_ids = [channel.id] # channel is a thread
             channel_ids.append(channel.parent_id)
 
-        if any(x in channel_ids for x in exclusive):
+        if not exclusive.isdisjoint(channel_ids):
             return
         
-        if any(x in thread_ids for x in exclusive):
+        if not exclusive.isdisjoint(thread_ids):
             return
 
-        mod_roles = settings.mod_roles.values()
-        if (any(x in mod_roles for x in roles)):
+        if not state.role_ids.isdisjoint(settings.mod_role_ids):
             return
 
         if settings.bad_word_detection:
-            for word in settings.bad_words:
-                regex = re.compile('\s*'.join(word), re.IGNORECASE)
+            for regex in settings.bad_word_patterns:
                 L = regex.findall(message.content)
                 if L:
                     try:
                         await message.delete()
                     except discord.NotFound:
-                        return
+                        return True
                     infraction = await self.bot.insert_infraction(
                         message.author.id,
                         self.bot.user.id,
@@ -519,7 +830,7 @@ class Moderation(commands.Cog):
                     )
 
                     await self.on_infraction(ctx, message.author, infraction)
-                    return
+                    return True
 
         if settings.domain_detection:
             url_regex = re.compile('http[s]?://(?:[a-zA-Z]|[0-9]|[$-_@.&+]|[!*(),]|(?:%[0-9a-fA-F][0-9a-fA-F]))+', re.IGNORECASE)
@@ -532,7 +843,7 @@ class Moderation(commands.Cog):
                     try:
                         await message.delete()
                     except discord.NotFound:
-                        return
+                        return True
                 
                     else:
                         infraction = await self.bot.insert_infraction(
@@ -545,7 +856,7 @@ class Moderation(commands.Cog):
                             )
                     
                         await self.on_infraction(ctx, message.author, infraction)
-                        return
+                        return True
 
             invite_regex = re.compile('(?:https?://)?discord(?:app)?\.(?:com/invite|gg)/[a-zA-Z0-9]+/?', re.IGNORECASE)
 
@@ -573,7 +884,7 @@ class Moderation(commands.Cog):
                     )
 
                     await self.on_infraction(ctx, message.author, infraction)
-                    return
+                    return True
 
 
 async def setup(bot: Bot) -> None:
@@ -47,6 +47,36 @@ class Settings(commands.Cog):
         self.bot.tree.copy_global_to(guild=guild)
         await ctx.send("👌")
 
+    @commands.command(name="dbpool")
+    @commands.is_owner()
+    async def db_pool(self, ctx: Context) -> None:
+        stats = self.bot.db.pool_stats()
+        await ctx.send("\n".join(f"**{k.replace('_', ' ').title()}:** {v}" for k, v in stats.items()))
+
+    @commands.command(name="dbindexes")
+    @commands.is_owner()
+    async def db_indexes(self, ctx: Context) -> None:
+        embed = Embed(
+            bot=self.bot,
+            title="Database Indexes",
+            description="Operations served by each index since the server last started."
+        )
+
+        for name, client in self.bot.collections.items():
+            try:
+                stats = await client.index_stats()
+            except Exception as e:
+                embed.add_field(name=name, value=f"Could not fetch the stats: {e}", inline=False)
+                continue
+
+            lines = [
+                f"`{s['name']}` - {s['accesses']['ops']} ops since {discord.utils.format_dt(s['accesses']['since'], 'R')}"
+                for s in sorted(stats, key=lambda s: s['name'])
+            ]
+            embed.add_field(name=name, value="\n".join(lines) or "No indexes", inline=False)
+
+        await ctx.send(embed=embed)
+
     settings_group = app_commands.Group(name="settings", description="The bot's settings for the current server.")
 
     @is_admin()
@@ -126,8 +156,6 @@ class Settings(commands.Cog):
         option: Literal['Domain Detection', 'Bad Word Detection', 'Use Timeout Instead of Mute'],
         value: Literal['True', 'False']
     ) -> None:
-        settings = await self.bot.get_guild_settings(interaction.guild_id)
-
         if value == 'True':
             value = True
         else:
@@ -140,7 +168,7 @@ class Settings(commands.Cog):
         elif option == 'Use Timeout Instead of Mute':
             doc_option = 'timeoutInsteadOfMute'
         
-        await self.bot.settings.update_one({'_id':settings.id}, {'$set':{doc_option:value}})
+        await self.bot.set_guild_setting(interaction.guild_id, doc_option, value)
 
         embed = Embed(
             bot=self.bot,
@@ -160,17 +188,7 @@ class Settings(commands.Cog):
         type: Literal['Bot', 'Message', 'Infractions'],
         channel: discord.TextChannel
     ) -> None:
-        settings = await self.bot.get_guild_settings(interaction.guild_id)
-
-        document = {
-            'bot':settings.log_channels['bot'],
-            'message':settings.log_channels['message'],
-            'infractions':settings.log_channels['infractions']
-        }
-
-        document[type.lower()] = channel.id
-
-        await self.bot.settings.update_one({'_id':settings.id}, {'$set':{'logChannels':document}})
+        await self.bot.set_guild_setting(interaction.guild_id, f'logChannels.{type.lower()}', channel.id)
 
         embed = Embed(
             bot=self.bot,
@@ -189,16 +207,7 @@ class Settings(commands.Cog):
         type: Literal['Admin', 'Bypass'],
         role: discord.Role
     ) -> None:
-        settings = await self.bot.get_guild_settings(interaction.guild_id)
-
-        document = {
-            'admin':settings.extra_roles['admin'],
-            'bypass':settings.extra_roles['bypass']
-        }
-
-        document[type.lower()] = role.id
-
-        await self.bot.settings.update_one({'_id':settings.id}, {'$set':{'extraRoles':document}})
+        await self.bot.set_guild_setting(interaction.guild_id, f'extraRoles.{type.lower()}', role.id)
 
         embed = Embed(
             bot=self.bot,
@@ -218,16 +227,7 @@ class Settings(commands.Cog):
         type: Literal['Mod', 'Senior Mod'],
         role: discord.Role
     ) -> None:
-        settings = await self.bot.get_guild_settings(interaction.guild_id)
-
-        document = {
-            'mod': settings.mod_roles['mod'],
-            'senior mod': settings.mod_roles['senior mod']
-        }
-
-        document[type.lower()] = role.id
-
-        await self.bot.settings.update_one({'_id':settings.id}, {'$set':{'modRoles':document}})
+        await self.bot.set_guild_setting(interaction.guild_id, f'modRoles.{type.lower()}', role.id)
 
         embed = Embed(
             bot=self.bot,
@@ -243,22 +243,14 @@ class Settings(commands.Cog):
     @settings_group.command(name='command-channel', description='Enables or Disables the command in the current channel.')
     @app_commands.describe(option='Toggle to enable/disable commands in the current channel.')
     async def command_channel(self, interaction: discord.Interaction, option: Literal['Enable', 'Disable']) -> None:
-        settings = await self.bot.get_guild_settings(interaction.guild_id)
-
         value = True if option == 'Enable' else False
         option = 'enabled' if value else 'disabled'
         channel = interaction.channel_id
 
         if not value:
-            if channel in settings.command_disabled_channels:
-                pass
-            else:
-                settings.command_disabled_channels.append(channel)
+            await self.bot.add_guild_setting(interaction.guild_id, 'commandDisabledChannels', channel)
         else:
-            if channel in settings.command_disabled_channels:
-                settings.command_disabled_channels.remove(channel)
-        
-        await self.bot.settings.update_one({'_id':settings.id}, {'$set':{'commandDisabledChannels':settings.command_disabled_channels}})
+            await self.bot.remove_guild_setting(interaction.guild_id, 'commandDisabledChannels', channel)
 
         embed = Embed(
             bot=self.bot,
@@ -278,22 +270,14 @@ class Settings(commands.Cog):
         option: Literal['Enable', 'Disable'],
         channel: Optional[Union[discord.TextChannel, discord.CategoryChannel, discord.ForumChannel]]
     ) -> None:
-        settings = await self.bot.get_guild_settings(interaction.guild_id)
-
         value = True if option == 'Enable' else False
         option = 'enabled' if value else 'disabled'
         channel = channel or interaction.channel
 
         if not value:
-            if channel.id in settings.detection_exclusive_channels:
-                pass
-            else:
-                settings.detection_exclusive_channels.append(channel.id)
+            await self.bot.add_guild_setting(interaction.guild_id, 'detectionExclusiveChannels', channel.id)
         else:
-            if channel.id in settings.detection_exclusive_channels:
-                settings.detection_exclusive_channels.remove(channel.id)
-
-        await self.bot.settings.update_one({'_id':settings.id}, {'$set':{'detectionExclusiveChannels':settings.detection_exclusive_channels}})
+            await self.bot.remove_guild_setting(interaction.guild_id, 'detectionExclusiveChannels', channel.id)
 
         embed = Embed(
             bot=self.bot,
@@ -308,9 +292,7 @@ class Settings(commands.Cog):
     @settings_group.command(name="mute-role", description="Set a mute role for the server.")
     @app_commands.describe(role="The role to set as mute role.")
     async def mute_role(self, interaction: discord.Interaction, role: discord.Role) -> None:
-        settings = await self.bot.get_guild_settings(interaction.guild_id)
-
-        await self.bot.settings.update_one({'_id':settings.id}, {'$set':{'muteRole':role.id}})
+        await self.bot.set_guild_setting(interaction.guild_id, 'muteRole', role.id)
 
         embed = Embed(
             bot=self.bot,
@@ -325,9 +307,7 @@ class Settings(commands.Cog):
     @settings_group.command(name="prefix", description="Changes the prefix of the bot for the server.")
     @app_commands.describe(prefix="The prefix to be set.")
     async def set_prefix(self, interaction: discord.Interaction, prefix: str) -> None:
-        settings = await self.bot.get_guild_settings(interaction.guild_id)
-
-        await self.bot.settings.update_one({'_id':settings.id}, {'$set':{'prefix':prefix}})
+        await self.bot.set_guild_setting(interaction.guild_id, 'prefix', prefix)
 
         embed = Embed(
             bot=self.bot,
@@ -354,7 +334,7 @@ class Settings(commands.Cog):
                 bot=self.bot,
                 title="Domains Whitelisted"
             )
-            pages = SimplePages(settings.domains_whitelisted, interaction=interaction, bot=self.bot, embed=embed)
+            pages = SimplePages(sorted(settings.domains_whitelisted), interaction=interaction, bot=self.bot, embed=embed)
             await pages.start()
         else:
             await interaction.response.send_message("No domains have been whitelisted.")
@@ -369,11 +349,7 @@ class Settings(commands.Cog):
             return await interaction.response.send_message(f"Domain: `{domain}` is already whitelisted.")
 
         else:
-            settings.domains_whitelisted.append(domain)
-            await self.bot.settings.update_one(
-                {'_id':settings.id},
-                {'$set':{'domainsWhitelisted':settings.domains_whitelisted}}
-            )
+            await self.bot.add_guild_setting(settings.id, 'domainsWhitelisted', domain)
 
             embed = Embed(
                 bot=self.bot,
@@ -391,12 +367,7 @@ class Settings(commands.Cog):
         settings = await self.bot.get_guild_settings(interaction.guild_id)
 
         if domain in settings.domains_whitelisted:
-            settings.domains_whitelisted.remove(domain)
-
-            await self.bot.settings.update_one(
-                {'_id':settings.id},
-                {'$set':{'domainsWhitelisted':settings.domains_whitelisted}}
-            )
+            await self.bot.remove_guild_setting(settings.id, 'domainsWhitelisted', domain)
 
             embed = Embed(
                 bot=self.bot,
@@ -426,7 +397,7 @@ class Settings(commands.Cog):
                 bot=self.bot,
                 title="Bad Words Registered"
             )
-            pages = SimplePages(settings.bad_words, interaction=interaction, bot=self.bot, embed=embed)
+            pages = SimplePages(sorted(settings.bad_words), interaction=interaction, bot=self.bot, embed=embed)
             await pages.start()
         else:
             await interaction.response.send_message("No bad words have been registered.")
@@ -441,11 +412,7 @@ class Settings(commands.Cog):
             return await interaction.response.send_message(f"Word: `{word}` is already registered.")
 
         else:
-            settings.bad_words.append(word)
-            await self.bot.settings.update_one(
-                {'_id':settings.id},
-                {'$set':{'badWords':settings.bad_words}}
-            )
+            await self.bot.add_guild_setting(settings.id, 'badWords', word)
 
             embed = Embed(
                 bot=self.bot,
@@ -463,12 +430,7 @@ class Settings(commands.Cog):
         settings = await self.bot.get_guild_settings(interaction.guild_id)
 
         if word in settings.bad_words:
-            settings.bad_words.remove(word)
-
-            await self.bot.settings.update_one(
-                {'_id':settings.id},
-                {'$set':{'badWords':settings.bad_words}}
-            )
+            await self.bot.remove_guild_setting(settings.id, 'badWords', word)
 
             embed = Embed(
                 bot=self.bot,
@@ -487,14 +449,9 @@ class Settings(commands.Cog):
     async def suppress_warns(self, interaction: discord.Interaction, channel: Union[discord.TextChannel, discord.CategoryChannel]):
         settings = await self.bot.get_guild_settings(interaction.guild_id)
         if channel.id in settings.suppress_warns:
-            settings.suppress_warns.remove(channel.id)
+            await self.bot.remove_guild_setting(settings.id, 'suppressWarns', channel.id)
         else:
-            settings.suppress_warns.append(channel.id)
-
-        await self.bot.settings.update_one(
-            {'_id':settings.id}, 
-            {'$set':{'suppressWarns':settings.suppress_warns}}
-        )
+            await self.bot.add_guild_setting(settings.id, 'suppressWarns', channel.id)
 
         embed = Embed(
             bot=self.bot,
@@ -513,6 +470,7 @@ class Settings(commands.Cog):
     async def insert_embed_data(self, data: dict, guild_id: int) -> CustomEmbeds:
         document = {
             'id':await self.get_id(guild_id),
+            'guild_id':guild_id,
             'embedData': data
         }
 
@@ -523,7 +481,7 @@ class Settings(commands.Cog):
         return CustomEmbeds(document)
 
     async def get_embed(self, id: int, guild_id: int) -> CustomEmbeds | None:
-        document = await self.bot.embeds.find_one({'id':id, 'guild_int':guild_id})
+        document = await self.bot.embeds.find_one({'guild_id':guild_id, 'id':id})
 
         if document:
             return CustomEmbeds(document)
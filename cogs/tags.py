@@ -16,29 +16,108 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from typing import Literal, Optional
+import logging
+import tempfile
+import orjson
+
+from itertools import islice
+from typing import Any, Literal, Optional
 import discord
 
 from discord import app_commands
-from discord.ext import commands
-from difflib import get_close_matches
-from utils import Bot, TagEntry, Embed, SimplePages, Context, check_perms, is_bot_channel, has_setting_role, TagNotFound
+from discord.ext import commands, tasks
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError
+from utils import Bot, TagEntry, Embed, SimplePages, CursorPages, CursorPageSource, is_admin, is_bot_channel, TagNotFound, ActionState, StageOrder, TagIndex, LRUCache
 
 OWNER_ERROR_MESSAGE = 'You cannot do this action since you do not own this tag.'
-
-class TagPageEntry:
-    __slots__ = ('name',)
-
-    def __init__(self, entry: TagEntry):
-        self.name = entry.name
-
-    def __str__(self) -> str:
-        return f'{self.name}'
-
-class TagPages(SimplePages):
-    def __init__(self, entries: list[TagEntry], *, interaction: discord.Interaction, bot: Bot, per_page: int = 12, **kwargs) -> None:
-        converted = [TagPageEntry(entry) for entry in entries]
-        super().__init__(converted, per_page=per_page, interaction=interaction, bot=bot, **kwargs)
+AUTOCOMPLETE_LIMIT = 25 # the most choices discord accepts
+USES_FLUSH_INTERVAL = 30 # seconds between writing the buffered tag uses
+MISSING_CACHE_SIZE = 256 # names remembered per guild as not being tags
+
+logger = logging.getLogger(__name__)
+
+IMPORT_BATCH_SIZE = 500 # tags written per bulk_write when importing
+IMPORT_ERROR_LIMIT = 10 # invalid lines reported back after an import
+
+# the fields written to an export, one JSON object per line
+EXPORT_PROJECTION = {'_id':0, 'name':1, 'content':1, 'owner':1, 'embed':1, 'button_urls':1, 'enable_embed':1, 'uses':1}
+
+# the fields the tag indexes are built from
+INDEX_PROJECTION = {'name':1, 'owner':1, 'guild':1, 'content':1, 'embed.title':1, 'embed.description':1}
+
+def searchable_content(document: dict) -> str:
+    embed = document.get('embed') or {}
+    return ' '.join(filter(None, (document.get('content'), embed.get('title'), embed.get('description'))))
+
+def index_tag(index: TagIndex, document: dict) -> None:
+    # one malformed document must not prevent the rest from being indexed
+    try:
+        index.add(document['name'], document['owner'], searchable_content(document))
+    except (KeyError, TypeError, AttributeError):
+        logger.warning(f"Skipped indexing the malformed tag {document.get('_id')}")
+
+def imported_tag(data: Any, *, owner: int) -> dict[str, Any]:
+    """Validates a line of an import into the fields of a tag.
+
+    The exported owner and uses are kept, tags without an owner are given to
+    the importer.
+    """
+    if not isinstance(data, dict):
+        raise ValueError("not a JSON object")
+
+    name = data.get('name')
+    if not isinstance(name, str) or not name:
+        raise ValueError("missing name")
+
+    content = data.get('content')
+    if content is not None and not isinstance(content, str):
+        raise ValueError("content is not a string")
+
+    embed = data.get('embed') or {}
+    if not isinstance(embed, dict):
+        raise ValueError("embed is not an object")
+
+    button_urls = data.get('button_urls') or []
+    if not isinstance(button_urls, list) or not all(isinstance(b, list) and len(b) == 2 for b in button_urls):
+        raise ValueError("button_urls is not a list of [label, url] pairs")
+
+    tag_owner = data.get('owner', owner)
+    if isinstance(tag_owner, bool) or not isinstance(tag_owner, int):
+        raise ValueError("owner is not an id")
+
+    fields = {
+        "name":name,
+        "content":content,
+        "owner":tag_owner,
+        "embed":embed,
+        "button_urls":button_urls,
+        "enable_embed":bool(data.get('enable_embed', False))
+    }
+
+    # restored when exported, tags without it keep their count or start at 0
+    if 'uses' in data:
+        uses = data['uses']
+        if isinstance(uses, bool) or not isinstance(uses, int) or uses < 0:
+            raise ValueError("uses is not a count")
+        fields['uses'] = uses
+
+    return fields
+
+class TagPages(CursorPages):
+    """Lists tag names, reading only the names of one page at a time."""
+
+    def __init__(self, bot: Bot, filter: dict, *, total: int, interaction: discord.Interaction, per_page: int = 12, **kwargs) -> None:
+        source = CursorPageSource(
+            bot.tags,
+            filter,
+            total=total,
+            projection={'_id':0, 'name':1},
+            sort=[('name', 1)],
+            per_page=per_page,
+            format_entry=lambda document: document['name']
+        )
+        super().__init__(source, interaction=interaction, bot=bot, **kwargs)
 
 class Revert(discord.ui.View):
     def __init__(self, invoker_id: int, timeout : float | None = 180):
@@ -62,21 +141,47 @@ class Revert(discord.ui.View):
 class Tags(commands.GroupCog, name="tag"):
     def __init__(self, bot: Bot):
         self.bot = bot
+        self._indexes: dict[int, TagIndex] = {} # guild id -> tag names
+        self._missing: dict[int, LRUCache] = {} # guild id -> names known not to be tags
         super().__init__()
 
-    async def get_tag(self, name: str, *, guild: int = None, update_uses: bool = False) -> TagEntry:
+    async def warm_up(self) -> None:
+        indexes: dict[int, TagIndex] = {}
+        async for document in self.bot.tags.find({}, INDEX_PROJECTION):
+            guild = document.get('guild', 0)
+            if guild not in indexes:
+                indexes[guild] = TagIndex(guild)
+            index_tag(indexes[guild], document)
+        # only stored once complete, a failed warm up leaves get_index to load lazily
+        self._indexes.update(indexes)
+
+    async def get_index(self, guild: int) -> TagIndex:
+        index = self._indexes.get(guild)
+        if index is None:
+            index = TagIndex(guild)
+            async for document in self.bot.tags.find({"guild":{"$eq":guild}}, INDEX_PROJECTION):
+                index_tag(index, document)
+            self._indexes[guild] = index
+        return index
+
+    def known_missing(self, guild: int) -> LRUCache:
+        missing = self._missing.get(guild)
+        if missing is None:
+            missing = self._missing[guild] = LRUCache(MISSING_CACHE_SIZE)
+        return missing
+
+    async def get_tag(self, name: str, *, guild: int = None, update_uses: bool = False, suggest: bool = True) -> TagEntry:
         
         query = {"name":{"$eq":name}, "guild":{"$eq":guild}}
-        search_query = {"guild":{"$eq":guild}}
             
         document = await self.bot.tags.find_one(query)
 
         if document is None:
-            searches = []
-            async for tag in self.bot.tags.find(search_query):
-                searches.append(tag['name'])
+            if not suggest:
+                raise TagNotFound("Tag not found.")
 
-            matches = get_close_matches(name, searches)
+            index = await self.get_index(guild)
+            matches = index.close_matches(name)
             if matches:
                 raise TagNotFound("Tag not found. Did you mean...\n"+"\n".join(m for m in matches))
             else:
@@ -85,9 +190,7 @@ class Tags(commands.GroupCog, name="tag"):
         tag = TagEntry(document=document)
 
         if update_uses:
-            uses = tag.uses
-            uses += 1
-            await self.bot.tags.update_one({'_id':tag._id}, {'$set':{'uses':uses}})
+            self.bot.tag_uses.add(tag._id)
 
         return tag
 
@@ -137,6 +240,8 @@ class Tags(commands.GroupCog, name="tag"):
         }
 
         insert = await self.bot.tags.insert_one(document)
+        self.known_missing(interaction.guild_id).pop(name, None)
+        (await self.get_index(interaction.guild_id)).add(name, interaction.user.id, searchable_content(document))
         await interaction.response.send_message(
             f"Tag with name `{name}` successfully created.\nHere is a specific id: `{insert.inserted_id}`. It is useless btw ;)"
         )
@@ -214,8 +319,14 @@ class Tags(commands.GroupCog, name="tag"):
             "fields":tag.embed.fields
         }
 
-        await self.bot.tags.update_one({'_id':tag._id}, {'$set':{'embed':embed_doc}})
-        await self.bot.tags.update_one({'_id':tag._id}, {'$set':{'enable_embed':enable}})
+        await self.bot.tags.update_one(
+            {'_id':tag._id},
+            {'$set':{'embed':embed_doc, 'enable_embed':enable}, '$inc':{'version':1}}
+        )
+        (await self.get_index(interaction.guild_id)).set_content(
+            tag.name,
+            searchable_content({'content':tag._content, 'embed':embed_doc})
+        )
 
         note = "Enable embed for the tag to see the embed in the output." 
         return await interaction.response.send_message(f"Tag embed successfully updated. {note if not enable else ''}")
@@ -232,7 +343,11 @@ class Tags(commands.GroupCog, name="tag"):
         if content == 'N/A':
             content = None
 
-        await self.bot.tags.update_one({'_id':tag._id}, {'$set':{'content':content}})
+        await self.bot.tags.update_one({'_id':tag._id}, {'$set':{'content':content}, '$inc':{'version':1}})
+        (await self.get_index(interaction.guild_id)).set_content(
+            tag.name,
+            searchable_content({'content':content, 'embed':{'title':tag.embed.title, 'description':tag.embed.description}})
+        )
         await interaction.response.send_message("Tag content successfully updated.")
 
     @edit.command(name="buttons", description="Add/Remove Link Button from the tag.")
@@ -277,7 +392,7 @@ class Tags(commands.GroupCog, name="tag"):
             tag._button_urls.append(button)
             description = f"Successfully added button ({label} → {url})."
 
-        await self.bot.tags.update_one({'_id':tag._id}, {'$set':{'button_urls':tag._button_urls}})
+        await self.bot.tags.update_one({'_id':tag._id}, {'$set':{'button_urls':tag._button_urls}, '$inc':{'version':1}})
 
         embed = Embed(
             title="Success",
@@ -314,7 +429,7 @@ class Tags(commands.GroupCog, name="tag"):
             embed.set_author(name=str(user), icon_url=user.display_avatar.url)
         
         embed.add_field(name="Owner", value=user.mention if user else f"<@{tag.owner}>")
-        embed.add_field(name="Uses", value=f"{tag.uses}")
+        embed.add_field(name="Uses", value=f"{tag.uses + self.bot.tag_uses.pending(tag._id)}")
         embed.add_field(name="Embed Enabled", value="Yes" if tag.enable_embed else "No")
 
         await interaction.response.send_message(embed=embed)
@@ -329,6 +444,8 @@ class Tags(commands.GroupCog, name="tag"):
             return await interaction.response.send_message(OWNER_ERROR_MESSAGE, ephemeral=True)
 
         await self.bot.tags.update_one({'_id':tag._id}, {'$set':{'owner':user.id}})
+        index = await self.get_index(interaction.guild_id)
+        index.transfer(tag.name, user.id)
 
         embed = Embed(
             bot=self.bot,
@@ -344,6 +461,7 @@ class Tags(commands.GroupCog, name="tag"):
         await view.wait()
         if view.value:
             await self.bot.tags.update_one({'_id':tag._id}, {'$set':{'owner':tag.owner}})
+            index.transfer(tag.name, tag.owner)
 
             embed.title = "Successfully Reverted Back!"
             embed.description = f"Tag successfully transferred back to {interaction.user.mention}"
@@ -382,43 +500,50 @@ class Tags(commands.GroupCog, name="tag"):
             await interaction.edit_original_message(embed=embed)
         else:
             await self.bot.tags.delete_one({'_id':tag._id})
+            (await self.get_index(interaction.guild_id)).remove(tag.name)
         
         
     @app_commands.command(name='all', description="Shows all the tags for the current server.")
     @is_bot_channel()
     async def tag_all(self, interaction: discord.Interaction) -> None:
-        tags = []
-        async for t in self.bot.tags.find({'guild':interaction.guild_id}):
-            tags.append(TagEntry(t))
+        filter = {'guild':interaction.guild_id}
+        total = await self.bot.tags.count_documents(filter)
 
-        if tags:
+        if total:
             embed = Embed(
                 bot=self.bot,
                 title="Server Tags"
             )
-            pages = TagPages(entries=tags, interaction=interaction, bot=self.bot, embed=embed)
+            pages = TagPages(self.bot, filter, total=total, interaction=interaction, embed=embed)
             await pages.start()
         else:
             await interaction.response.send_message('This server has no tags.')
         
 
     @app_commands.command(name="search", description="Searches for a tag.")
-    @app_commands.describe(name="The tag name to search for.")
+    @app_commands.describe(
+        name="The tag name to search for.",
+        match="How to match the tags, by default similar names are ranked first."
+    )
     @is_bot_channel()
-    async def tag_search(self, interaction: discord.Interaction, name: str) -> None:
-        tags: list[TagEntry] = []
-        async for t in self.bot.tags.find({"guild":interaction.guild_id}):
-            tags.append(TagEntry(t))
+    async def tag_search(
+        self,
+        interaction: discord.Interaction,
+        name: str,
+        match: Optional[Literal['Similar', 'Prefix', 'Substring', 'Content']]
+    ) -> None:
+        index = await self.get_index(interaction.guild_id)
 
-        matches = get_close_matches(name, [t.name for t in tags], n=int(len(tags)//1.5), cutoff=0.45)
+        mode = 'fuzzy' if match in (None, 'Similar') else match.lower()
+        matches = index.search(name, mode)
 
         if matches:
-            possibilities = []
-            for t in tags:
-                if t.name in matches:
-                    possibilities.append(t)
-
-            pages = TagPages(entries=possibilities, interaction=interaction, bot=self.bot)
+            embed = Embed(
+                bot=self.bot,
+                title=f"Tags matching {name}"
+            )
+            entries = [f'{n} ({score:.0%})' for n, score in matches]
+            pages = SimplePages(entries, interaction=interaction, bot=self.bot, embed=embed)
             await pages.start()
         else:
             await interaction.response.send_message("Could not find a tag with that name")
@@ -427,29 +552,173 @@ class Tags(commands.GroupCog, name="tag"):
     @app_commands.describe(user="The user whose tags you want to see.")
     @is_bot_channel()
     async def tag_list(self, interaction: discord.Interaction, user: discord.Member) -> None:
-        tags = []
-        async for t in self.bot.tags.find({'guild':interaction.guild_id, "owner":user.id}):
-            tags.append(TagEntry(t))
+        filter = {'guild':interaction.guild_id, "owner":user.id}
+        total = await self.bot.tags.count_documents(filter)
 
-        if tags:
+        if total:
             embed = Embed(
                 bot=self.bot,
                 title=f"All tags by {user}"
             )
-            pages = TagPages(entries=tags, interaction=interaction, bot=self.bot, embed=embed)
+            pages = TagPages(self.bot, filter, total=total, interaction=interaction, embed=embed)
             await pages.start()
         else:
             await interaction.response.send_message(f"{user} has not made any tags.")
 
     
-    @commands.Cog.listener("on_message")
-    async def message_tags(self, message: discord.Message) -> None:
+    @app_commands.command(name="export", description="Exports the server's tags as a JSON Lines file.")
+    @is_admin()
+    async def tag_export(self, interaction: discord.Interaction) -> None:
+        await interaction.response.defer()
+        # the buffered uses are written first so that the export has them
+        await self.flush_tag_uses()
+
+        count = 0
+        # written to disk as the cursor is read instead of being collected in memory
+        with tempfile.TemporaryFile() as fp:
+            async for document in self.bot.tags.find({'guild':interaction.guild_id}, EXPORT_PROJECTION, batch_size=IMPORT_BATCH_SIZE):
+                fp.write(orjson.dumps(document, default=str))
+                fp.write(b'\n')
+                count += 1
+
+            if not count:
+                return await interaction.followup.send('This server has no tags.')
+
+            if fp.tell() > interaction.guild.filesize_limit:
+                return await interaction.followup.send(f"The export of {count} tags is too large to upload.")
+
+            fp.seek(0)
+            await interaction.followup.send(
+                f"Exported {count} tags.",
+                file=discord.File(fp, filename=f"tags-{interaction.guild_id}.jsonl")
+            )
+
+    @app_commands.command(name="import", description="Imports tags from a JSON Lines file made by /tag export.")
+    @app_commands.describe(
+        file="The .jsonl file, one tag per line.",
+        overwrite="Whether to replace the tags which already exist, by default they are skipped."
+    )
+    @is_admin()
+    async def tag_import(
+        self,
+        interaction: discord.Interaction,
+        file: discord.Attachment,
+        overwrite: Optional[Literal['Yes', 'No']]
+    ) -> None:
+        await interaction.response.defer()
+
+        guild = interaction.guild_id
+        replace = overwrite == 'Yes'
+        batch: list[UpdateOne] = []
+        created = updated = 0
+        errors: list[str] = []
+
+        async def write() -> None:
+            nonlocal created, updated
+            try:
+                result = await self.bot.tags.bulk_write(batch, ordered=False)
+            except BulkWriteError as e:
+                # the unordered batch still wrote the operations which did not fail
+                created += e.details.get('nUpserted', 0)
+                updated += e.details.get('nModified', 0)
+                raise
+            created += result.upserted_count
+            updated += result.modified_count
+            batch.clear()
+
+        failure = None
+        try:
+            async with self.bot.session.get(file.url) as response:
+                if response.status != 200:
+                    return await interaction.followup.send("Could not download the file.")
+
+                line_number = 0
+                # read line by line, only one batch of tags is held at a time
+                async for line in response.content:
+                    line_number += 1
+                    if not line.strip():
+                        continue
+
+                    try:
+                        fields = imported_tag(orjson.loads(line), owner=interaction.user.id)
+                    except (orjson.JSONDecodeError, ValueError) as e:
+                        errors.append(f"Line {line_number}: {e}")
+                        continue
+
+                    name = fields.pop('name')
+                    if replace:
+                        update = {'$set':fields, '$inc':{'version':1}}
+                        if 'uses' not in fields:
+                            update['$setOnInsert'] = {'uses':0}
+                    else:
+                        update = {'$setOnInsert':{'uses':0, **fields}}
+                    batch.append(UpdateOne({'guild':guild, 'name':name}, update, upsert=True))
+
+                    if len(batch) >= IMPORT_BATCH_SIZE:
+                        await write()
+
+                if batch:
+                    await write()
+        except Exception as e:
+            logger.exception(f"Could not import the tags of guild {guild}")
+            failure = e
+        finally:
+            # rebuilt from the database on the next lookup, including after a
+            # failure since some of the tags may have been written already
+            self._indexes.pop(guild, None)
+            self._missing.pop(guild, None)
+
+        message = f"Imported {created} new tags" + (f" and updated {updated} existing ones." if replace else ".")
+        if failure is not None:
+            message = f"The import stopped because of an error ({failure.__class__.__name__}).\nBefore it, {message[0].lower()}{message[1:]}"
+        if errors:
+            shown = "\n".join(errors[:IMPORT_ERROR_LIMIT])
+            more = len(errors) - IMPORT_ERROR_LIMIT
+            message += f"\nSkipped {len(errors)} invalid lines:\n{shown}" + (f"\n...and {more} more" if more > 0 else "")
+        await interaction.followup.send(message[:2000])
+
+    @tag_view.autocomplete('name')
+    @edit_embed.autocomplete('name')
+    @edit_content.autocomplete('name')
+    @edit_buttons.autocomplete('name')
+    @info.autocomplete('name')
+    @transfer.autocomplete('name')
+    @delete.autocomplete('name')
+    async def tag_name_autocomplete(self, interaction: discord.Interaction, current: str) -> list[app_commands.Choice[str]]:
+        # answered from the in-memory index, names starting with the input first
+        index = await self.get_index(interaction.guild_id)
+
+        names = list(islice(index.starting_with(current), AUTOCOMPLETE_LIMIT))
+        if len(names) < AUTOCOMPLETE_LIMIT and current:
+            seen = set(names)
+            extra = (n for n, _ in index.search(current, 'substring') if n not in seen)
+            names.extend(islice(extra, AUTOCOMPLETE_LIMIT - len(names)))
+
+        # choices are limited to 100 characters
+        return [app_commands.Choice(name=n, value=n) for n in names if len(n) <= 100]
+
+    async def cog_load(self) -> None:
+        self.bot.add_message_stage('tags', self.message_tags, order=StageOrder.tags)
+        self.flush_tag_uses.start()
+
+    async def cog_unload(self) -> None:
+        self.bot.remove_message_stage('tags')
+        self.flush_tag_uses.cancel()
+        await self.flush_tag_uses()
+
+    @tasks.loop(seconds=USES_FLUSH_INTERVAL)
+    async def flush_tag_uses(self) -> None:
+        try:
+            await self.bot.tag_uses.flush()
+        except Exception:
+            logger.exception("Could not flush the tag uses")
+
+    async def message_tags(self, state: ActionState) -> None:
+        ctx = state.ctx
+        message = ctx.message
         if message.guild is None:
             return
-        if message.author.bot:
-            return
 
-        ctx = await self.bot.get_context(message, cls=Context)
         if ctx.valid:
             return
         if ctx.prefix and message.content.startswith(ctx.prefix):
@@ -457,19 +726,22 @@ class Tags(commands.GroupCog, name="tag"):
         else:
             return
 
-        settings = await self.bot.get_guild_settings(message.guild.id)
-
         checks = (
-            await check_perms(ctx, {'manage_messages':True}) or
-            await has_setting_role(ctx, 'admin')
+            state.has_permissions(manage_messages=True) or
+            state.has_setting_role('admin')
         )
 
         if not checks:
-            if ctx.channel.id in settings.command_disabled_channels:
+            if ctx.channel.id in state.settings.command_disabled_channels:
                 return
+        # most prefixed messages which are not commands are not tags either
+        missing = self.known_missing(ctx.guild.id)
+        if name in missing:
+            return
         try:
-            tag = await self.get_tag(name, guild=ctx.guild.id, update_uses=True)
+            tag = await self.get_tag(name, guild=ctx.guild.id, update_uses=True, suggest=False)
         except TagNotFound:
+            missing[name] = None
             return        
         
         values = tag.send_values()
@@ -1,10 +1,11 @@
 from .bot import Bot
 from .context import Context
-from .db import Client
+from .db import Client, IncrementBuffer
 from .models import (
     Infraction, 
     TagEntry, 
     Cache, 
+    LRUCache,
     CaseInsensitiveDict, 
     Embed, 
     URL, 
@@ -15,7 +16,10 @@ from .models import (
     format_dt,
     CustomEmbeds
 )
-from .paginator import SimplePages, TextPageSource, FieldPageSource, SimplePageSource, EmbedPages, TextPages
-from .checks import check_perms, is_admin, is_bot_channel, can_bypass, has_setting_role, has_permissions, is_mod, can_close_threads
+from .search import TagIndex
+from .pipeline import ActionState, MessageStage, StageOrder
+from .scheduler import ExpiryScheduler
+from .paginator import SimplePages, CursorPageSource, CursorPages, TextPageSource, FieldPageSource, SimplePageSource, EmbedPages, TextPages
+from .checks import get_state, check_perms, is_admin, is_bot_channel, can_bypass, has_setting_role, has_permissions, is_mod, can_close_threads
 from .errors import ReasonError, CannotUseBotCommand, TagNotFound
 from .roblox import User, RoWifiUser, Member, Role
\ No newline at end of file
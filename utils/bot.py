@@ -25,19 +25,63 @@ import dotenv
 import random
 import logging
 import sys
+import time
 
-from typing import Literal, Optional, Union, Any
+from typing import Awaitable, Callable, Literal, Optional, Union, Any
 from discord.ext import commands
+from bson import ObjectId
+from pymongo import ASCENDING, DESCENDING, IndexModel, ReturnDocument
 
-from .db import Client
+from .db import Client, IncrementBuffer
 from .context import Context
-from .models import GuildSettings, Infraction, InfractionType
+from .models import GuildSettings, Infraction, InfractionType, LRUCache
+from .pipeline import ActionState, MessageStage, StageOrder
+from .scheduler import ExpiryScheduler
 
 dotenv.load_dotenv()
 
 URI = os.environ.get("URI") #mongodb uri
 TOKEN = os.environ.get("TOKEN") #bot token
 
+# optional tuning of the shared mongodb connection pool, env variable -> motor option
+MONGO_OPTIONS = {
+    "MONGO_MAX_POOL_SIZE":"maxPoolSize",
+    "MONGO_MIN_POOL_SIZE":"minPoolSize",
+    "MONGO_MAX_IDLE_TIME_MS":"maxIdleTimeMS",
+    "MONGO_WAIT_QUEUE_TIMEOUT_MS":"waitQueueTimeoutMS",
+    "MONGO_CONNECT_TIMEOUT_MS":"connectTimeoutMS",
+    "MONGO_SOCKET_TIMEOUT_MS":"socketTimeoutMS",
+    "MONGO_SERVER_SELECTION_TIMEOUT_MS":"serverSelectionTimeoutMS"
+}
+
+def mongo_options() -> dict[str, int]:
+    return {option:int(os.environ[env]) for env, option in MONGO_OPTIONS.items() if os.environ.get(env)}
+
+# infractions counting towards the automatic punishments
+ACTIVE_INFRACTIONS = {'deleted':False, 'expired':{'$ne':True}}
+ACTIVE_COUNTS_CACHE_SIZE = 4096 # (guild, offender) pairs whose active infractions are counted in memory
+
+# the indexes every collection needs, ensured when the bot starts
+INDEXES = {
+    "Tags":[
+        IndexModel([("guild", ASCENDING), ("name", ASCENDING)], name="guild_name", unique=True),
+        IndexModel([("guild", ASCENDING), ("owner", ASCENDING), ("name", ASCENDING)], name="guild_owner_name")
+    ],
+    "Infractions":[
+        IndexModel([("guild_id", ASCENDING), ("id", ASCENDING)], name="guild_id_id", unique=True),
+        # also serve /warns, which lists the newest infractions first
+        IndexModel([("guild_id", ASCENDING), ("offender", ASCENDING), ("_id", DESCENDING)], name="guild_id_offender_created"),
+        IndexModel([("guild_id", ASCENDING), ("moderator", ASCENDING), ("_id", DESCENDING)], name="guild_id_moderator_created"),
+        IndexModel([("guild_id", ASCENDING), ("_id", DESCENDING)], name="guild_id_created"), # /modstats
+        IndexModel([("expired", ASCENDING), ("until", ASCENDING)], name="expired_until")
+    ],
+    "Settings":[], # looked up by _id only
+    "Counters":[], # looked up by _id only
+    "Embeds":[
+        IndexModel([("guild_id", ASCENDING), ("id", ASCENDING)], name="guild_id_id")
+    ]
+}
+
 os.environ["JISHAKU_NO_UNDERSCORE"] = "True"
 os.environ["JISHAKU_NO_DM_TRACEBACK"] = "True" 
 os.environ["JISHAKU_HIDE"] = "True"
@@ -75,11 +119,8 @@ async def prefix(bot, message: discord.Message):
         base.append(".")
     
     else:
-        settings: dict = await bot.settings.find_one({"_id":message.guild.id})
-        if settings is None:
-            base.append(".")
-        else:
-            base.append(settings.get('prefix', '.'))
+        # served from memory, see Bot.warm_up
+        base.append(bot.prefixes.get(message.guild.id, "."))
 
     return commands.when_mentioned_or(*base)(bot, message)
 
@@ -112,40 +153,140 @@ class Bot(commands.Bot):
         self.colour = discord.Colour.blue()
         self.version = __version__
 
+        # guild id -> GuildSettings, kept in sync by update_guild_settings
+        self._guild_settings: dict[int, GuildSettings] = {}
+        self.settings_cache_hits: int = 0
+        self.settings_cache_misses: int = 0
+        # guild id -> prefix, loaded once at startup by warm_up
+        self.prefixes: dict[int, str] = {}
+        # guilds whose infraction counter has been checked against their infractions
+        self._seeded_counters: set[int] = set()
+        # (guild id, offender id) -> number of active infractions, adjusted as they are
+        # inserted, removed and expire instead of being counted again
+        self._active_infractions: LRUCache = LRUCache(ACTIVE_COUNTS_CACHE_SIZE)
+
+        # ordered stages every message goes through, see on_message
+        self.message_stages: list[MessageStage] = []
+        self.add_message_stage('commands', self.invoke_stage, order=StageOrder.commands)
+
         self.description = "An open-source multi-purpose bot designed mainly for support purposes for the Discord Server RoWifi HQ."
     
     async def on_ready(self) -> None:
         print(f'Ready {self.user} (ID: {self.user.id})')
 
+        # the warm up loads every stored guild, drop the ones the bot is no longer in
+        joined = {g.id for g in self.guilds}
+        for id in [id for id in self._guild_settings if id not in joined]:
+            self.invalidate_guild_settings(id)
+            self.prefixes.pop(id, None)
+
         if not hasattr(self, 'uptime'):
             self.uptime = discord.utils.utcnow()
 
     async def setup_hook(self) -> None:
         self.session = aiohttp.ClientSession()
-        self.loop.create_task(self.create_sessions())
+        await self.create_sessions()
+        await self.ensure_indexes()
+        self.loop.create_task(self.change_status())
         for ext in self.initial_extensions:
             try:
                 await self.load_extension(ext)
             except Exception as e:
                 raise e
+        await self.warm_up()
+        self.expiry.start()
         self.footer = self.user.name
         
         
     async def close(self) -> None:
+        if hasattr(self, 'tag_uses'):
+            try:
+                await self.tag_uses.flush()
+            except Exception:
+                logger.exception("Could not flush the tag uses")
+        if hasattr(self, 'expiry'):
+            self.expiry.stop()
         await super().close()
         if hasattr(self, 'session'):
             await self.session.close()
+        if hasattr(self, 'db'):
+            self.db.client.close()
 
     async def create_sessions(self) -> None:
-        db = "Utilities"
+        if not hasattr(self, 'db'):
+            # one motor client, and hence one connection pool, for every collection
+            self.db = Client(URI, "Utilities", **mongo_options())
         if not hasattr(self, 'tags'):
-            self.tags = Client(URI, db, 'Tags')
+            self.tags = self.db.get_collection('Tags')
         if not hasattr(self, 'infractions'):
-            self.infractions = Client(URI, db, 'Infractions')
+            self.infractions = self.db.get_collection('Infractions')
         if not hasattr(self, 'settings'):
-            self.settings = Client(URI, db, 'Settings')
+            self.settings = self.db.get_collection('Settings')
         if not hasattr(self, 'embeds'):
-            self.embeds = Client(URI, db, 'Embeds')
+            self.embeds = self.db.get_collection('Embeds')
+        if not hasattr(self, 'counters'):
+            # guild id -> the last ids handed out, see get_next_infraction_ids
+            self.counters = self.db.get_collection('Counters')
+        if not hasattr(self, 'tag_uses'):
+            # flushed periodically by the Tags cog and when closing
+            self.tag_uses = IncrementBuffer(self.tags, 'uses')
+        if not hasattr(self, 'expiry'):
+            self.expiry = ExpiryScheduler(self)
+
+    @property
+    def collections(self) -> dict[str, Client]:
+        """The clients of every collection, by collection name."""
+        return {
+            "Tags":self.tags,
+            "Infractions":self.infractions,
+            "Settings":self.settings,
+            "Embeds":self.embeds,
+            "Counters":self.counters
+        }
+
+    async def ensure_indexes(self) -> None:
+        """Creates the missing indexes declared in ``INDEXES``.
+
+        Existing indexes are left as they are, so this is cheap on every start.
+        """
+        start = time.perf_counter()
+        for name, client in self.collections.items():
+            await client.ensure_indexes(INDEXES.get(name, []))
+        logger.info(f"Ensured the database indexes in {time.perf_counter() - start:.2f}s")
+
+    async def warm_up(self) -> None:
+        """Fills the caches before the bot connects to the gateway.
+
+        Loads the settings (and hence the prefixes) of every guild with one cursor,
+        then awaits the ``warm_up`` coroutine of every cog which has one.
+        """
+        start = time.perf_counter()
+
+        count = 0
+        async for document in self.settings.find({}):
+            try:
+                self._store_guild_settings(GuildSettings(document))
+            except KeyError as e:
+                logger.warning(f"Skipped warming up the settings of guild {document['_id']}, missing {e}")
+            except Exception:
+                # the guild is loaded on demand instead, one bad document must not stop the bot
+                logger.exception(f"Skipped warming up the settings of guild {document.get('_id')}")
+            else:
+                count += 1
+
+        for name, cog in self.cogs.items():
+            warm_up = getattr(cog, 'warm_up', None)
+            if warm_up is not None:
+                try:
+                    await warm_up()
+                except Exception:
+                    # the cog fills its caches on demand instead
+                    logger.exception(f"Could not warm up the {name} cog")
+
+        self.warm_up_duration = time.perf_counter() - start
+        logger.info(f"Warmed up the settings of {count} guilds in {self.warm_up_duration:.2f}s")
+
+    async def change_status(self) -> None:
         temp = [
             ("playing", "with ItsArtemiz"),
             ("playing", "with RoWifi"),
@@ -161,39 +302,190 @@ class Bot(commands.Bot):
     async def get_context(self, origin: Union[discord.Message, discord.Interaction], *, cls=None):
         return await super().get_context(origin, cls=Context)
 
+    def add_message_stage(
+        self,
+        name: str,
+        callback: Callable[[ActionState], Awaitable[Optional[bool]]],
+        *,
+        order: int
+    ) -> None:
+        """Adds a stage to the message pipeline.
+
+        Parameters
+        ----------
+        name : str
+            The unique name of the stage, used to remove it.
+        callback : Callable[[ActionState], Awaitable[Optional[bool]]]
+            The coroutine called with the message state. Returning ``True``
+            stops the message from reaching the later stages.
+        order : int
+            Where the stage runs, stages with a lower order run first. See `StageOrder`.
+        """
+        self.remove_message_stage(name)
+        self.message_stages.append(MessageStage(name, order, callback))
+        self.message_stages.sort(key=lambda s: s.order)
+
+    def remove_message_stage(self, name: str) -> None:
+        self.message_stages = [s for s in self.message_stages if s.name != name]
+
+    async def on_message(self, message: discord.Message) -> None:
+        if message.author.bot:
+            return
+
+        ctx: Context = await self.get_context(message)
+        state = await ActionState.from_context(ctx)
+        ctx.state = state
+
+        for stage in self.message_stages:
+            try:
+                if await stage.callback(state):
+                    break
+            except Exception:
+                logger.exception(f"Message stage {stage.name} failed for message {message.id}")
+
+    async def invoke_stage(self, state: ActionState) -> None:
+        await self.invoke(state.ctx)
+
+    async def on_guild_remove(self, guild: discord.Guild) -> None:
+        self.invalidate_guild_settings(guild.id)
+        self.prefixes.pop(guild.id, None)
+
+    def _store_guild_settings(self, settings: GuildSettings) -> GuildSettings:
+        cached = self._guild_settings.get(settings.id)
+        if cached is not None and cached.revision > settings.revision:
+            # a newer update was stored while this document was on its way
+            return cached
+        self._guild_settings[settings.id] = settings
+        self.prefixes[settings.id] = settings.prefix
+        return settings
+
     async def get_guild_settings(self, id: int, /) -> GuildSettings:
-        document = await self.settings.find_one({'_id':id})
-        if document:
-            return GuildSettings(document)
-        
-        document = {
-            '_id':id,
-            'prefix':'.',
-            'logChannels':{'bot':None, 'message':None},
-            'extraRoles':{'admin':None, 'bypass':None},
-            'modRoles':{'mod': None, 'senior mod':None},
-            'commandDisabledChannels':[],
-            'badWords':[],
-            'domainsWhitelisted':[],
-            'detectionExclusiveChannels':[],
-            'muteRole':None,
-            'domainDetection':False,
-            'badWordDetection':False,
-            'timeoutInsteadOfMute':False,
-            'ticketsChannel':None
+        settings = self._guild_settings.get(id)
+        if settings is not None:
+            self.settings_cache_hits += 1
+            return settings
+
+        self.settings_cache_misses += 1
+        # find-or-create in one atomic round-trip, the defaults are only written for new guilds
+        document = await self.settings.find_one_and_update(
+            {'_id':id},
+            {'$setOnInsert':{
+                'prefix':'.',
+                'logChannels':{'bot':None, 'message':None},
+                'extraRoles':{'admin':None, 'bypass':None},
+                'modRoles':{'mod': None, 'senior mod':None},
+                'commandDisabledChannels':[],
+                'badWords':[],
+                'domainsWhitelisted':[],
+                'detectionExclusiveChannels':[],
+                'muteRole':None,
+                'domainDetection':False,
+                'badWordDetection':False,
+                'timeoutInsteadOfMute':False,
+                'ticketsChannel':None
+            }},
+            upsert=True
+        )
+        return self._store_guild_settings(GuildSettings(document))
+
+    async def update_guild_settings(self, id: int, update: dict, /) -> GuildSettings:
+        """Applies an update to the guild's settings document and writes the
+        updated document through to the settings cache.
+
+        Parameters
+        ----------
+        id : int
+            The id of the guild.
+        update : dict
+            The MongoDB update document, e.g. ``{'$set':{'prefix':'!'}}``.
+
+        Returns
+        -------
+        GuildSettings
+            The settings after the update has been applied.
+        """
+        # the revision orders the replies of concurrent updates, see _store_guild_settings
+        update = {**update, '$inc':{**update.get('$inc', {}), 'revision':1}}
+        document = await self.settings.find_one_and_update({'_id':id}, update)
+        if document is None:
+            # the guild has no document yet, create the defaults and try again
+            self.invalidate_guild_settings(id)
+            await self.get_guild_settings(id)
+            document = await self.settings.find_one_and_update({'_id':id}, update)
+
+        return self._store_guild_settings(GuildSettings(document))
+
+    async def set_guild_setting(self, id: int, field: str, value: Any, /) -> GuildSettings:
+        """Atomically sets a single field, dotted paths such as ``logChannels.bot`` work too."""
+        return await self.update_guild_settings(id, {'$set':{field:value}})
+
+    async def add_guild_setting(self, id: int, field: str, value: Any, /) -> GuildSettings:
+        """Atomically adds a value to an array field if it is not already present."""
+        return await self.update_guild_settings(id, {'$addToSet':{field:value}})
+
+    async def remove_guild_setting(self, id: int, field: str, value: Any, /) -> GuildSettings:
+        """Atomically removes every occurrence of a value from an array field."""
+        return await self.update_guild_settings(id, {'$pull':{field:value}})
+
+    def invalidate_guild_settings(self, id: int, /) -> None:
+        self._guild_settings.pop(id, None)
+
+    @property
+    def settings_cache_info(self) -> dict[str, int]:
+        return {
+            'size':len(self._guild_settings),
+            'hits':self.settings_cache_hits,
+            'misses':self.settings_cache_misses
         }
 
-        await self.settings.insert_one(document)
-        return GuildSettings(document)
-
-    async def get_infraction(self, id: int, guild_id: int, /) -> Optional[Infraction]:
-        document = await self.infractions.find_one({'id':id, 'guild_id':guild_id})
+    async def get_infraction(self, id: int, guild_id: int, /, *, include_deleted: bool = True) -> Optional[Infraction]:
+        query = {'guild_id':guild_id, 'id':id}
+        if not include_deleted:
+            query['deleted'] = False
+        document = await self.infractions.find_one(query)
         if document:
             return Infraction(document)
         return
 
-    async def get_next_infraction_id(self) -> int:
-        return (await self.infractions.count_documents({})) + 1
+    async def _seed_infraction_counter(self, guild_id: int, /) -> None:
+        # infraction ids used to be counted over the whole collection, so the
+        # counter has to start after the highest id the guild already has
+        document = await self.infractions.find_one({'guild_id':guild_id}, {'id':1}, sort=[('id', -1)])
+        if document is not None:
+            await self.counters.update_one({'_id':guild_id}, {'$max':{'infractions':document['id']}}, upsert=True)
+        self._seeded_counters.add(guild_id)
+
+    async def get_next_infraction_ids(self, guild_id: int, count: int = 1, /) -> range:
+        """Reserves the ids of new infractions of a guild.
+
+        The ids come from an atomic counter per guild, so concurrent infractions
+        never share an id.
+
+        Parameters
+        ----------
+        guild_id : int
+            The guild the infractions belong to.
+        count : int, optional
+            The number of ids to reserve, by default 1
+
+        Returns
+        -------
+        range
+            The consecutive ids reserved.
+        """
+        if guild_id not in self._seeded_counters:
+            await self._seed_infraction_counter(guild_id)
+
+        document = await self.counters.find_one_and_update(
+            {'_id':guild_id},
+            {'$inc':{'infractions':count}},
+            upsert=True
+        )
+        last = document['infractions']
+        return range(last - count + 1, last + 1)
+
+    async def get_next_infraction_id(self, guild_id: int, /) -> int:
+        return (await self.get_next_infraction_ids(guild_id))[0]
 
     async def insert_infraction(
         self,
@@ -204,10 +496,8 @@ class Bot(commands.Bot):
         until: Optional[float],
         guild_id: int
     ) -> Infraction:
-        pass
-
         document = {
-            "id":await self.get_next_infraction_id(),
+            "id":await self.get_next_infraction_id(guild_id),
             "moderator":moderator_id,
             "offender":offender_id,
             "reason":reason,
@@ -219,9 +509,98 @@ class Bot(commands.Bot):
 
         insert = await self.infractions.insert_one(document)
         document['_id'] = insert.inserted_id
+        self.adjust_active_infraction_count(guild_id, offender_id, 1)
+        self.expiry.schedule(insert.inserted_id, until)
 
         return Infraction(document)
 
+    async def insert_infractions(
+        self,
+        offender_ids: list[int],
+        moderator_id: int,
+        reason: str,
+        type: InfractionType,
+        until: Optional[float],
+        guild_id: int
+    ) -> list[Infraction]:
+        """Inserts the same infraction for many offenders.
+
+        The ids are reserved in one counter update and the documents are written
+        with a single ``insert_many``.
+
+        Returns
+        -------
+        list[Infraction]
+            The infractions, in the order of the offenders.
+        """
+        if not offender_ids:
+            return []
+
+        ids = await self.get_next_infraction_ids(guild_id, len(offender_ids))
+        documents = [
+            {
+                "id":id,
+                "moderator":moderator_id,
+                "offender":offender_id,
+                "reason":reason,
+                "type":type.value,
+                "deleted":False,
+                "until":until,
+                "guild_id":guild_id
+            }
+            for id, offender_id in zip(ids, offender_ids)
+        ]
+
+        insert = await self.infractions.insert_many(documents, ordered=False)
+        for document, _id in zip(documents, insert.inserted_ids):
+            document['_id'] = _id
+            self.adjust_active_infraction_count(guild_id, document['offender'], 1)
+            self.expiry.schedule(_id, until)
+
+        return [Infraction(document) for document in documents]
+
+    async def remove_infraction(self, _id: ObjectId, /) -> bool:
+        """Marks an infraction as deleted.
+
+        Returns
+        -------
+        bool
+            Whether the infraction was removed, ``False`` if it already was.
+        """
+        document = await self.infractions.find_one_and_update(
+            {'_id':_id, 'deleted':False},
+            {'$set':{'deleted':True}},
+            {'guild_id':1, 'offender':1, 'expired':1},
+            return_document=ReturnDocument.BEFORE
+        )
+        if document is None:
+            return False
+
+        if not document.get('expired', False):
+            self.adjust_active_infraction_count(document['guild_id'], document['offender'], -1)
+        return True
+
+    async def get_active_infraction_count(self, guild_id: int, offender_id: int, /) -> int:
+        """The number of infractions of a user which are neither deleted nor expired.
+
+        Counted with one indexed query the first time, then kept up to date in memory.
+        """
+        key = (guild_id, offender_id)
+        count = self._active_infractions.get(key)
+        if count is None:
+            count = await self.infractions.count_documents({'guild_id':guild_id, 'offender':offender_id, **ACTIVE_INFRACTIONS})
+            self._active_infractions[key] = count
+        return count
+
+    def adjust_active_infraction_count(self, guild_id: int, offender_id: int, delta: int, /) -> None:
+        key = (guild_id, offender_id)
+        # pairs which are not cached are counted from the database when needed
+        if key in self._active_infractions:
+            self._active_infractions[key] = max(self._active_infractions[key] + delta, 0)
+
+    def invalidate_active_infraction_count(self, guild_id: int, offender_id: int, /) -> None:
+        self._active_infractions.pop((guild_id, offender_id), None)
+
     async def post_log(
         self,
         guild: discord.Guild,
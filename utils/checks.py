@@ -3,23 +3,38 @@
 
 import discord
 
-from typing import Literal, Union
+from typing import Union
 from discord import app_commands
 from discord.ext import commands
 
 from .context import Context
-from .bot import Bot
 from .errors import CannotUseBotCommand
+from .pipeline import ActionState, ROLE
 
+ROWIFI_HELP_FORUM = 1006727091083038800
 
+async def get_state(action: Union[discord.Interaction, Context]) -> ActionState:
+    """Gets the state of the message or interaction, computing it only once.
 
-ROLE = Literal['admin', 'bypass']
-
-ROWIFI_HELP_FORUM = 1006727091083038800
+    The state is stored on the interaction's extras or on the context, so every
+    check of a command shares one context, one settings lookup and one role scan.
+    """
+    if isinstance(action, discord.Interaction):
+        state: ActionState = action.extras.get('state')
+        if state is None:
+            ctx: Context = await action.client.get_context(action, cls=Context)
+            state = await ActionState.from_context(ctx)
+            ctx.state = state
+            action.extras['state'] = state
+        return state
+
+    if action.state is None:
+        action.state = await ActionState.from_context(action)
+    return action.state
 
 async def get_context(action: Union[discord.Interaction, Context]) -> Context:
     if isinstance(action, discord.Interaction):
-        return await action.client.get_context(action, cls=Context)
+        return (await get_state(action)).ctx
     return action
 
 async def check_perms(
@@ -29,38 +44,26 @@ async def check_perms(
     check=all
 ) -> bool:
     if isinstance(action, discord.Interaction):
-        ctx: Context = await action.client.get_context(action, cls=Context)
         error = app_commands.NoPrivateMessage()
     else:
-        ctx = action
         error = commands.NoPrivateMessage()
 
-    is_owner = await ctx.bot.is_owner(ctx.author)
-    if is_owner:
+    state = await get_state(action)
+    if state.is_owner:
         return True
 
-    if ctx.guild is None:
+    if state.ctx.guild is None:
         raise error
 
-    resolved = ctx.channel.permissions_for(ctx.author)
-    return check(getattr(resolved, name, None) == value for name, value in perms.items())
+    return state.has_permissions(check=check, **perms)
     
 async def has_setting_role(action: Union[discord.Interaction, Context], role: ROLE) -> bool:
-    ctx = await get_context(action)
     pre = await check_perms(action, {'administrator':True})
     if pre:
         return True
     
-    bot: Bot = ctx.bot
-    settings = await bot.get_guild_settings(ctx.guild.id)
-
-    user_roles: list[int] = [r.id for r in ctx.author.roles]
-    if settings.extra_roles[role] in user_roles:
-        return True
-    elif settings.extra_roles['admin'] in user_roles:
-        return True
-    else:
-        return False
+    state = await get_state(action)
+    return state.has_setting_role(role)
 
 def has_permissions(slash=True, *, check=all, **perms: bool):
     async def pred(action: Union[discord.Interaction, Context]):
@@ -98,23 +101,13 @@ def can_bypass():
 
 def is_mod(senior=False):
     async def pred(interaction: discord.Interaction):
-        ctx = await get_context(interaction)
         pre = await has_setting_role(interaction, 'admin')
 
         if pre:
             return True
 
-        bot: Bot = ctx.bot
-        user_roles: list[int] = [r.id for r in ctx.author.roles]
-        
-        settings = await bot.get_guild_settings(interaction.guild_id)
-
-        if senior and (settings.mod_roles['senior mod'] in user_roles):
-            return True
-        elif settings.mod_roles['mod'] in user_roles and (senior is not True):
-            return True
-        else:
-            return False
+        state = await get_state(interaction)
+        return state.is_mod(senior)
     return app_commands.check(pred)
 
 def is_bot_channel():
@@ -126,10 +119,9 @@ def is_bot_channel():
         if pre:
             return True
         
-        bot: Bot = interaction.client
-        settings = await bot.get_guild_settings(interaction.guild_id)
+        state = await get_state(interaction)
 
-        if interaction.channel_id in settings.command_disabled_channels:
+        if interaction.channel_id in state.settings.command_disabled_channels:
             raise CannotUseBotCommand(interaction.channel)
         else:
             return True
@@ -137,16 +129,13 @@ def is_bot_channel():
 
 def can_close_threads():
     async def predicate(action: Union[discord.Interaction, Context]):
-        ctx = await get_context(action)
+        state = await get_state(action)
+        ctx = state.ctx
         if not isinstance(ctx.channel, discord.Thread):
             return False
-            
-        settings = await ctx.bot.get_guild_settings(ctx.guild.id)
-
-        user_roles = [r.id for r in ctx.author.roles]
 
         return ctx.channel.parent_id == ROWIFI_HELP_FORUM and (
-            (any(x in settings.mod_roles.values() for x in user_roles)) or ctx.channel.owner_id == ctx.author.id
+            not state.role_ids.isdisjoint(state.settings.mod_role_ids) or ctx.channel.owner_id == ctx.author.id
         )
 
     return commands.check(predicate)
@@ -16,16 +16,22 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from typing import Any, Optional
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any, Optional
 import aiohttp
 import discord
 
 from discord.ext import commands
 
+if TYPE_CHECKING:
+    from .pipeline import ActionState
+
 class Context(commands.Context):
     message: discord.Message
     def __init__(self, **attrs):
         self.bot = attrs.get('bot', None)
+        self.state: Optional[ActionState] = None
         super().__init__(**attrs)
 
     def __repr__(self) -> str:
@@ -16,8 +16,15 @@ You should have received a copy of the GNU General Public License
 along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
-from typing import Iterable, Optional
-from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorCursor
+import copy
+import logging
+import threading
+
+from collections import Counter
+from typing import Any, Iterable, Optional
+from motor.motor_asyncio import AsyncIOMotorClient, AsyncIOMotorCollection, AsyncIOMotorCommandCursor, AsyncIOMotorCursor
+from pymongo import IndexModel, ReturnDocument, UpdateOne, monitoring
+from pymongo.errors import BulkWriteError, OperationFailure
 from pymongo.results import (
     BulkWriteResult,
     DeleteResult,
@@ -26,6 +33,79 @@ from pymongo.results import (
     UpdateResult
 )
 
+logger = logging.getLogger(__name__)
+
+class PoolMonitor(monitoring.ConnectionPoolListener):
+    """Keeps track of the connection pool of a client.
+
+    PyMongo publishes the pool events from its own threads, hence the lock.
+    """
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self.open: int = 0
+        self.in_use: int = 0
+        self.waiting: int = 0
+        self.peak_in_use: int = 0
+        self.checkouts: int = 0
+        self.failed_checkouts: int = 0
+        self.cleared: int = 0
+
+    def pool_created(self, event: monitoring.PoolCreatedEvent) -> None:
+        pass
+
+    def pool_ready(self, event: monitoring.PoolReadyEvent) -> None:
+        pass
+
+    def pool_cleared(self, event: monitoring.PoolClearedEvent) -> None:
+        with self._lock:
+            self.cleared += 1
+
+    def pool_closed(self, event: monitoring.PoolClosedEvent) -> None:
+        pass
+
+    def connection_created(self, event: monitoring.ConnectionCreatedEvent) -> None:
+        with self._lock:
+            self.open += 1
+
+    def connection_ready(self, event: monitoring.ConnectionReadyEvent) -> None:
+        pass
+
+    def connection_closed(self, event: monitoring.ConnectionClosedEvent) -> None:
+        with self._lock:
+            self.open -= 1
+
+    def connection_check_out_started(self, event: monitoring.ConnectionCheckOutStartedEvent) -> None:
+        with self._lock:
+            self.waiting += 1
+
+    def connection_check_out_failed(self, event: monitoring.ConnectionCheckOutFailedEvent) -> None:
+        with self._lock:
+            self.waiting -= 1
+            self.failed_checkouts += 1
+
+    def connection_checked_out(self, event: monitoring.ConnectionCheckedOutEvent) -> None:
+        with self._lock:
+            self.waiting -= 1
+            self.in_use += 1
+            self.checkouts += 1
+            self.peak_in_use = max(self.peak_in_use, self.in_use)
+
+    def connection_checked_in(self, event: monitoring.ConnectionCheckedInEvent) -> None:
+        with self._lock:
+            self.in_use -= 1
+
+    def stats(self) -> dict[str, int]:
+        with self._lock:
+            return {
+                'open':self.open,
+                'in_use':self.in_use,
+                'peak_in_use':self.peak_in_use,
+                'waiting':self.waiting,
+                'checkouts':self.checkouts,
+                'failed_checkouts':self.failed_checkouts,
+                'cleared':self.cleared
+            }
+
 class Client:
     def __init__(self, uri: str, db: str, collection: str = None, *, tz_aware = True, connect = True, **kwargs):
         """Forms a client connection with the MongoDB Database.
@@ -42,13 +122,52 @@ class Client:
             Makes the client connection timezone aware, by default True
         connect : bool, optional
             To reconnect to the Client connection automatically in the background, by default True
+        **kwargs
+            Passed to `AsyncIOMotorClient`, e.g. ``maxPoolSize`` or ``serverSelectionTimeoutMS``.
+
+        Use `get_collection` to access other collections over the same connection pool.
         """
-        client = AsyncIOMotorClient(uri, tz_aware=tz_aware, connect=connect, **kwargs)
+        self.monitor = PoolMonitor()
+        listeners = [*kwargs.pop('event_listeners', []), self.monitor]
+        client = AsyncIOMotorClient(uri, tz_aware=tz_aware, connect=connect, event_listeners=listeners, **kwargs)
+        self.client = client
         db = client[db]
         self.db = db
         if collection:
             self._collection = db[collection]
 
+    def get_collection(self, name: str) -> "Client":
+        """Creates a client for another collection of the same database.
+
+        The returned client shares the underlying Motor client, database handle
+        and connection pool with this one.
+
+        Parameters
+        ----------
+        name : str
+            The name of the collection to access.
+
+        Returns
+        -------
+        Client
+            The client accessing the collection.
+        """
+        client = copy.copy(self)
+        client.collection = name
+        return client
+
+    def pool_stats(self) -> dict[str, int]:
+        """The utilisation of the connection pool shared by this client.
+
+        Returns
+        -------
+        dict[str, int]
+            The connection counts along with the configured ``max_pool_size``.
+        """
+        stats = self.monitor.stats()
+        stats['max_pool_size'] = self.client.delegate.options.pool_options.max_pool_size
+        return stats
+
     @property
     def collection(self) -> AsyncIOMotorCollection:
         """The collection currently accessing.
@@ -74,7 +193,7 @@ class Client:
         return await self.collection.insert_one(document, **kwargs)
 
     async def insert_many(self, documents: Iterable[dict], ordered=True, **kwargs) -> InsertManyResult:
-        return await self.collection.insert_many(documents, ordered=True, **kwargs)
+        return await self.collection.insert_many(documents, ordered=ordered, **kwargs)
 
     async def delete_one(self, filter: dict, **kwargs) -> DeleteResult:
         return await self.collection.delete_one(filter, **kwargs)
@@ -93,3 +212,115 @@ class Client:
 
     async def update_many(self, filter: dict, update: dict, **kwargs) -> UpdateResult:
         return await self.collection.update_many(filter, update, **kwargs)
+
+    async def bulk_write(self, requests: list, ordered=True, **kwargs) -> BulkWriteResult:
+        return await self.collection.bulk_write(requests, ordered=ordered, **kwargs)
+
+    def aggregate(self, pipeline: list[dict], **kwargs) -> AsyncIOMotorCommandCursor:
+        return self.collection.aggregate(pipeline, **kwargs)
+
+    async def ensure_indexes(self, indexes: Iterable[IndexModel]) -> list[str]:
+        """Creates the indexes of the collection which do not exist yet.
+
+        Each index is created on its own so that one which cannot be built, e.g. a
+        unique index over duplicated documents, does not prevent the others from
+        being created. Such failures are logged.
+
+        Parameters
+        ----------
+        indexes : Iterable[IndexModel]
+            The indexes the collection requires.
+
+        Returns
+        -------
+        list[str]
+            The names of the indexes that exist on the collection afterwards.
+        """
+        ensured = []
+        for index in indexes:
+            try:
+                ensured.extend(await self.collection.create_indexes([index]))
+            except OperationFailure as e:
+                name = index.document['name']
+                logger.error(f"Could not create the index {name} on {self.collection.name}: {e}")
+        return ensured
+
+    async def index_stats(self) -> list[dict]:
+        """The usage of the collection's indexes since the server started.
+
+        Returns
+        -------
+        list[dict]
+            The ``$indexStats`` of every index, with the ``name``, ``key`` and
+            ``accesses`` (``ops`` and ``since``) of each.
+        """
+        return await self.aggregate([{'$indexStats':{}}]).to_list(length=None)
+
+    async def find_one_and_update(
+        self,
+        filter: dict,
+        update: dict,
+        *args,
+        return_document: bool = ReturnDocument.AFTER,
+        **kwargs
+    ) -> Optional[dict]:
+        return await self.collection.find_one_and_update(filter, update, *args, return_document=return_document, **kwargs)
+
+class IncrementBuffer:
+    def __init__(self, client: Client, field: str):
+        """Collects ``$inc`` updates of a field in memory to write them in one go.
+
+        Parameters
+        ----------
+        client : Client
+            The client of the collection the documents belong to.
+        field : str
+            The numeric field to increment.
+        """
+        self.client = client
+        self.field = field
+        self._pending: Counter[Any] = Counter() # _id -> increment
+
+    def __len__(self) -> int:
+        return len(self._pending)
+
+    def add(self, _id: Any, amount: int = 1) -> None:
+        self._pending[_id] += amount
+
+    def pending(self, _id: Any) -> int:
+        """The increment of a document which has not been written yet."""
+        return self._pending.get(_id, 0)
+
+    async def flush(self) -> int:
+        """Writes the pending increments with a single unordered ``bulk_write``.
+
+        When some operations of the write fail, only those are kept for the next
+        flush. On any other error, e.g. a network error, every increment is kept,
+        so one the server applied before the connection failed is applied again:
+        the increments are delivered at least once.
+
+        Returns
+        -------
+        int
+            The number of documents updated.
+        """
+        if not self._pending:
+            return 0
+
+        pending, self._pending = self._pending, Counter()
+        requests = [UpdateOne({'_id':_id}, {'$inc':{self.field:amount}}) for _id, amount in pending.items()]
+        try:
+            await self.client.bulk_write(requests, ordered=False)
+        except BulkWriteError as e:
+            # the other operations of the unordered write were applied
+            ids = list(pending)
+            for error in e.details.get('writeErrors', []):
+                _id = ids[error['index']]
+                self._pending[_id] += pending[_id]
+            raise
+        except Exception:
+            # keep them for the next flush
+            self._pending.update(pending)
+            raise
+
+        return len(requests)
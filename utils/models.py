@@ -17,12 +17,15 @@ along with this program.  If not, see <https://www.gnu.org/licenses/>.
 """
 
 import datetime
+import re
 import time
 import aiohttp
 import discord
 
 from typing import Any, Dict, Iterable, Iterator, List, Literal, Mapping, Optional, Tuple, TypeVar, Union
+from collections import OrderedDict
 from enum import Enum
+from types import MappingProxyType
 from discord.ext import commands
 from discord.utils import MISSING
 from bson import ObjectId
@@ -129,22 +132,54 @@ class InfractionType(Enum):
         return self.name
 
 class Infraction:
+    """An infraction document.
+
+    Only the stored fields are read when it is created. The ObjectId creation
+    time, the ``until`` datetime, the type and the colour are derived on first
+    access, so loops which only count or filter infractions stay cheap.
+    """
+    __slots__ = ('_id', 'id', 'moderator', 'offender', 'deleted', 'reason', '_type', '_until', 'guild_id', '_created', '_until_dt')
+
     def __init__(self, document: dict) -> None:
-        self._document: dict = document
-        self._id: ObjectId = ObjectId(document['_id'])
+        self._id: ObjectId = document['_id']
         self.id: int = document['id']
         self.moderator: int = document['moderator']
         self.offender: int = document['offender']
         self.deleted: bool = document.get('deleted', False)
         self.reason: str = document['reason']
-        self.type: InfractionType = InfractionType(document['type'])
-        self.created: datetime.datetime = self._id.generation_time
-        self.until: Optional[float] = document.get('until')
-        if isinstance(self.until, float):
-            self.until: datetime.datetime = datetime.datetime.utcfromtimestamp(self.until)
-        self.colour: InfractionColour = InfractionColour[self.type.name]
+        self._type: int = document['type']
+        self._until: Optional[float] = document.get('until')
         self.guild_id: int = document['guild_id']
+        self._created: Optional[datetime.datetime] = None
+        self._until_dt: Optional[datetime.datetime] = None
 
+    @property
+    def type(self) -> InfractionType:
+        return InfractionType(self._type)
+
+    @property
+    def colour(self) -> InfractionColour:
+        try:
+            return InfractionColour[self.type.name]
+        except KeyError:
+            # InfractionType.timout
+            return InfractionColour.timeout
+
+    @property
+    def created(self) -> datetime.datetime:
+        if self._created is None:
+            _id = self._id if isinstance(self._id, ObjectId) else ObjectId(self._id)
+            self._created = _id.generation_time
+        return self._created
+
+    @property
+    def until(self) -> Optional[datetime.datetime]:
+        if self._until_dt is None:
+            if isinstance(self._until, datetime.datetime):
+                self._until_dt = self._until
+            elif isinstance(self._until, (int, float)):
+                self._until_dt = datetime.datetime.fromtimestamp(self._until, datetime.timezone.utc)
+        return self._until_dt
 
     @property
     def case(self) -> str:
@@ -321,6 +356,33 @@ class Cache(CaseInsensitiveDict):
         for k in keys_to_del:
             self.__delitem__(k)
 
+class LRUCache(OrderedDict):
+    """
+    A dictionary holding at most `maxsize` items, the least recently used item is dropped first.
+
+    Only `__getitem__`, `get` and `__setitem__` count as a use.
+    """
+    def __init__(self, maxsize: int = 128) -> None:
+        self.maxsize = maxsize
+        super().__init__()
+
+    def __getitem__(self, k: _KT) -> _VT:
+        value = super().__getitem__(k)
+        self.move_to_end(k)
+        return value
+
+    def get(self, key: _KT, default=None):
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __setitem__(self, k: _KT, v: _VT) -> None:
+        super().__setitem__(k, v)
+        self.move_to_end(k)
+        if len(self) > self.maxsize:
+            self.popitem(last=False)
+
 class Embed(discord.Embed):
     def __init__(self, *, bot=None, footer: str = None, **kwargs) -> None:
         super().__init__(**kwargs)
@@ -354,6 +416,9 @@ class TagEmbed:
         self.fields: list = doc.get('fields', [])
 
 class TagEntry:
+    # (tag id, version) -> (content, embed, button labels and urls), the edit commands bump the version
+    _rendered: LRUCache = LRUCache(512)
+
     def __init__(self, document: dict) -> None:
         self._id: ObjectId = document['_id']
         self.name: str = document['name']
@@ -367,6 +432,7 @@ class TagEntry:
         self.owner: int = document['owner']
         self.guild: int = document.get('guild', 0)
         self._button_urls: list[list[str]] = document.get('button_urls', []) # [["label","url"], ...]
+        self.version: int = document.get('version', 0)
 
     @property
     def content(self) -> str | None:
@@ -386,18 +452,13 @@ class TagEntry:
     def uses(self, value:int) -> None:
         self.uses = value
 
-    def send_values(self) -> dict[str, Any]:
-        to_return = {
-            "content":self.content,
-            "embed":MISSING,
-            "view":MISSING
-        }
+    def _render(self) -> tuple[str | None, discord.Embed, tuple[tuple[str, str], ...]]:
+        embed = MISSING
         if self.enable_embed:
             embed = discord.Embed(
                 title=self.embed.title,
                 description=self.embed.description,
                 colour=self.embed.colour,
-                timestamp=discord.utils.utcnow(),
                 url=self.embed.url
             )
 
@@ -407,44 +468,123 @@ class TagEntry:
             if self.embed.fields:
                 for field in self.embed.fields:
                     embed.add_field(name=field[0], value=field[1], inline=field[2])
-            to_return['embed'] = embed
 
-        if self._button_urls:
+        buttons = tuple((label, url) for label, url in self._button_urls)
+
+        return self.content, embed, buttons
+
+    def send_values(self) -> dict[str, Any]:
+        key = (self._id, self.version)
+        rendered = TagEntry._rendered.get(key)
+        if rendered is None:
+            rendered = self._render()
+            TagEntry._rendered[key] = rendered
+
+        content, embed, buttons = rendered
+        if embed is not MISSING:
+            # only the timestamp changes between sends
+            embed = embed.copy()
+            embed.timestamp = discord.utils.utcnow()
+
+        view = MISSING
+        if buttons:
+            # a view is stored per message until it times out, so every send gets its own
             view = discord.ui.View()
+            for label, url in buttons:
+                view.add_item(discord.ui.Button(style=discord.ButtonStyle.link, label=label, url=url))
 
-            for button_list in self._button_urls:
-                button_list: list[str]
-                
-                button = discord.ui.Button(
-                    style=discord.ButtonStyle.link,
-                    label=button_list[0],
-                    url=button_list[1],
-                )
+        return {
+            "content":content,
+            "embed":embed,
+            "view":view
+        }
 
-                view.add_item(button)
-            
-            to_return['view'] = view
+def bad_word_patterns(words: Iterable[Any]) -> tuple[re.Pattern, ...]:
+    """Compiles the bad words into patterns which also match them spaced out.
 
-        return to_return
+    The words are escaped so that characters like ``(`` or ``*`` match literally,
+    entries which are not words are skipped.
+    """
+    return tuple(
+        re.compile(r'\s*'.join(map(re.escape, word)), re.IGNORECASE)
+        for word in words
+        if isinstance(word, str) and word
+    )
 
 class GuildSettings:
+    """The settings of a guild.
+
+    Instances are cached and shared, so they are immutable. The channel, word and
+    domain collections are frozensets for O(1) membership checks on every message.
+    """
+    __slots__ = (
+        'id',
+        'prefix',
+        'log_channels',
+        'extra_roles',
+        'mod_roles',
+        'command_disabled_channels',
+        'bad_words',
+        'domains_whitelisted',
+        'detection_exclusive_channels',
+        'mute_role',
+        'domain_detection',
+        'bad_word_detection',
+        'timeout_instead_of_mute',
+        'tickets_channel',
+        'suppress_warns',
+        'revision',
+        'mod_role_ids',
+        'bad_word_patterns'
+    )
+
     def __init__(self, document: dict) -> None:
-        self._document: dict = document
-        self.id: int = document['_id'] #guild id
-        self.prefix: str = document['prefix']
-        self.log_channels: dict[str, int | None] = document['logChannels']
-        self.extra_roles: dict[str, int | None] = document['extraRoles']
-        self.mod_roles: dict[str, int | None] = document['modRoles']
-        self.command_disabled_channels: list[int] = document['commandDisabledChannels']
-        self.bad_words: list[str] = document['badWords']
-        self.domains_whitelisted: list[str] = document['domainsWhitelisted']
-        self.detection_exclusive_channels: list[int] = document['detectionExclusiveChannels']
-        self.mute_role: int | None = document.get('muteRole', None)
-        self.domain_detection: bool = document['domainDetection']
-        self.bad_word_detection: bool = document['badWordDetection']
-        self.timeout_instead_of_mute: bool = document['timeoutInsteadOfMute']
-        self.tickets_channel: int | None = document.get('ticketsChannel')
-        self.suppress_warns: List[int] = document.get('suppressWarns', [])
+        set_ = super().__setattr__
+        set_('id', document['_id']) #guild id
+        set_('prefix', document['prefix'])
+        set_('log_channels', MappingProxyType(document['logChannels']))
+        set_('extra_roles', MappingProxyType(document['extraRoles']))
+        set_('mod_roles', MappingProxyType(document['modRoles']))
+        set_('command_disabled_channels', frozenset(document['commandDisabledChannels']))
+        set_('bad_words', frozenset(document['badWords']))
+        set_('domains_whitelisted', frozenset(document['domainsWhitelisted']))
+        set_('detection_exclusive_channels', frozenset(document['detectionExclusiveChannels']))
+        set_('mute_role', document.get('muteRole', None))
+        set_('domain_detection', document['domainDetection'])
+        set_('bad_word_detection', document['badWordDetection'])
+        set_('timeout_instead_of_mute', document['timeoutInsteadOfMute'])
+        set_('tickets_channel', document.get('ticketsChannel'))
+        set_('suppress_warns', frozenset(document.get('suppressWarns', [])))
+        set_('revision', document.get('revision', 0)) # bumped by every update
+
+        # derived data used by the message handlers
+        set_('mod_role_ids', frozenset(r for r in self.mod_roles.values() if r is not None))
+        set_('bad_word_patterns', bad_word_patterns(self.bad_words))
+
+    id: int
+    prefix: str
+    log_channels: Mapping[str, int | None]
+    extra_roles: Mapping[str, int | None]
+    mod_roles: Mapping[str, int | None]
+    command_disabled_channels: frozenset[int]
+    bad_words: frozenset[str]
+    domains_whitelisted: frozenset[str]
+    detection_exclusive_channels: frozenset[int]
+    mute_role: int | None
+    domain_detection: bool
+    bad_word_detection: bool
+    timeout_instead_of_mute: bool
+    tickets_channel: int | None
+    suppress_warns: frozenset[int]
+    revision: int
+    mod_role_ids: frozenset[int]
+    bad_word_patterns: tuple[re.Pattern, ...]
+
+    def __setattr__(self, name: str, value: Any) -> None:
+        raise AttributeError(f"{self.__class__.__name__} is immutable, use Bot.update_guild_settings instead.")
+
+    def __delattr__(self, name: str) -> None:
+        raise AttributeError(f"{self.__class__.__name__} is immutable, use Bot.update_guild_settings instead.")
 
 class CustomEmbeds:
     def __init__(self, document: dict) -> None:
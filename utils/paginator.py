@@ -1,15 +1,18 @@
 from __future__ import annotations
 
 import asyncio
-from typing import TYPE_CHECKING, Any, Dict, Optional
+from typing import TYPE_CHECKING, Any, Callable, Dict, Optional
 import discord
 from discord.ext import commands
 from discord.ext.commands import Paginator as CommandPaginator
 from discord.ext import menus
 
+from .models import LRUCache
+
 if TYPE_CHECKING:
     from .context import Context
     from .bot import Bot
+    from .db import Client
 
 
 class RoboPages(discord.ui.View):
@@ -260,6 +263,78 @@ class SimplePageSource(menus.ListPageSource):
         menu.embed.description = '\n'.join(pages)
         return menu.embed
 
+class CursorPageSource(menus.PageSource):
+    """A page source that reads its entries from the database page by page.
+
+    Pages are fetched as they are shown instead of loading every document
+    up front. Each page is one limited query, so no server cursor is left
+    open between pages or after the menu stops, and the last few pages
+    shown are kept around for going back.
+
+    The number of documents has to be known before the menu is built, so it
+    is passed as ``total``.
+    """
+
+    def __init__(
+        self,
+        client: Client,
+        filter: dict,
+        *,
+        total: int,
+        projection: Optional[dict] = None,
+        sort: Optional[list] = None,
+        per_page: int = 12,
+        format_entry: Callable[[dict], str] = str,
+        cached_pages: int = 8
+    ):
+        self.client = client
+        self.filter = filter
+        self.total = total
+        self.projection = projection
+        self.sort = sort
+        self.per_page = per_page
+        self.format_entry = format_entry
+        self._pages: LRUCache = LRUCache(cached_pages)
+
+    def is_paginating(self) -> bool:
+        return self.total > self.per_page
+
+    def get_max_pages(self) -> int:
+        pages, left_over = divmod(self.total, self.per_page)
+        if left_over:
+            pages += 1
+        return max(pages, 1)
+
+    async def get_page(self, page_number: int) -> list[dict]:
+        page = self._pages.get(page_number)
+        if page is not None:
+            return page
+
+        # the limit lets the server close the cursor with the only batch it returns
+        cursor = self.client.find(self.filter, self.projection, skip=page_number * self.per_page, limit=self.per_page)
+        if self.sort:
+            cursor = cursor.sort(self.sort)
+
+        page = await cursor.to_list(length=self.per_page)
+        if not page:
+            raise IndexError(page_number)
+
+        self._pages[page_number] = page
+        return page
+
+    async def format_page(self, menu, entries):
+        pages = []
+        for index, entry in enumerate(entries, start=menu.current_page * self.per_page):
+            pages.append(f'{index + 1}. {self.format_entry(entry)}')
+
+        maximum = self.get_max_pages()
+        if maximum > 1:
+            footer = f'Page {menu.current_page + 1}/{maximum} ({self.total} entries)'
+            menu.embed.set_footer(text=footer)
+
+        menu.embed.description = '\n'.join(pages)
+        return menu.embed
+
 class SimplePages(RoboPages):
     """A simple pagination session reminiscent of the old Pages interface.
 
@@ -270,6 +345,13 @@ class SimplePages(RoboPages):
         super().__init__(SimplePageSource(entries, per_page=per_page), interaction=interaction, bot=bot)
         self.embed = kwargs.get('embed', discord.Embed(colour=bot.colour))
 
+class CursorPages(RoboPages):
+    """Like :class:`SimplePages`, with the entries read lazily from the database."""
+
+    def __init__(self, source: CursorPageSource, *, interaction: discord.Interaction, bot: Bot, **kwargs):
+        super().__init__(source, interaction=interaction, bot=bot)
+        self.embed = kwargs.get('embed', discord.Embed(colour=bot.colour))
+
 class EmbedPages(RoboPages):
     def __init__(self, entries, *, interaction: discord.Interaction, bot: Bot, per_page: int = 12, **kwargs):
         super().__init__(FieldPageSource(entries, per_page=per_page, **kwargs), interaction=interaction, bot=bot)
@@ -0,0 +1,139 @@
+"""
+The message pipeline
+Copyright (C) 2021-present ItsArtemiz (Augadh Verma)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import discord
+
+from enum import IntEnum
+from typing import TYPE_CHECKING, Awaitable, Callable, Literal, NamedTuple, Optional
+
+from .models import GuildSettings
+
+if TYPE_CHECKING:
+    from .context import Context
+
+ROLE = Literal['admin', 'bypass']
+
+class StageOrder(IntEnum):
+    """The order in which the message stages run, lowest first."""
+    detection = 10
+    commands = 20
+    tags = 30
+
+class MessageStage(NamedTuple):
+    name: str
+    order: int
+    callback: Callable[[ActionState], Awaitable[Optional[bool]]]
+
+class ActionState:
+    """Everything the message stages and checks need to know about a message
+    or an interaction, computed once.
+
+    The results of the checks are memoized, so stacked checks only pay for
+    the first evaluation. A stage returning ``True`` stops the message from
+    reaching the later stages.
+    """
+    __slots__ = ('ctx', 'settings', 'role_ids', 'permissions', 'is_owner', '_checks')
+
+    def __init__(
+        self,
+        ctx: Context,
+        settings: Optional[GuildSettings],
+        role_ids: frozenset[int],
+        permissions: Optional[discord.Permissions],
+        is_owner: bool
+    ) -> None:
+        self.ctx: Context = ctx
+        self.settings: Optional[GuildSettings] = settings
+        self.role_ids: frozenset[int] = role_ids
+        self.permissions: Optional[discord.Permissions] = permissions
+        self.is_owner: bool = is_owner
+        self._checks: dict[tuple, bool] = {}
+
+    @classmethod
+    async def from_context(cls, ctx: Context) -> ActionState:
+        is_owner = await ctx.bot.is_owner(ctx.author)
+        if ctx.guild is None:
+            return cls(ctx, None, frozenset(), None, is_owner)
+
+        settings = await ctx.bot.get_guild_settings(ctx.guild.id)
+        role_ids = frozenset(r.id for r in getattr(ctx.author, 'roles', ()))
+        permissions = ctx.channel.permissions_for(ctx.author)
+
+        return cls(ctx, settings, role_ids, permissions, is_owner)
+
+    @property
+    def message(self) -> discord.Message:
+        return self.ctx.message
+
+    def has_permissions(self, *, check=all, **perms: bool) -> bool:
+        key = ('permissions', check, *sorted(perms.items()))
+        try:
+            return self._checks[key]
+        except KeyError:
+            pass
+
+        if self.is_owner:
+            result = True
+        elif self.permissions is None:
+            result = False
+        else:
+            result = check(getattr(self.permissions, name, None) == value for name, value in perms.items())
+
+        self._checks[key] = result
+        return result
+
+    def has_setting_role(self, role: ROLE) -> bool:
+        key = ('setting_role', role)
+        try:
+            return self._checks[key]
+        except KeyError:
+            pass
+
+        if self.has_permissions(administrator=True):
+            result = True
+        elif self.settings is None:
+            result = False
+        else:
+            result = (
+                self.settings.extra_roles[role] in self.role_ids or
+                self.settings.extra_roles['admin'] in self.role_ids
+            )
+
+        self._checks[key] = result
+        return result
+
+    def is_mod(self, senior: bool = False) -> bool:
+        key = ('mod', senior)
+        try:
+            return self._checks[key]
+        except KeyError:
+            pass
+
+        if self.has_setting_role('admin'):
+            result = True
+        elif self.settings is None:
+            result = False
+        elif senior:
+            result = self.settings.mod_roles['senior mod'] in self.role_ids
+        else:
+            result = self.settings.mod_roles['mod'] in self.role_ids
+
+        self._checks[key] = result
+        return result
@@ -0,0 +1,261 @@
+"""
+The infraction expiry scheduler
+Copyright (C) 2021-present ItsArtemiz (Augadh Verma)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+from __future__ import annotations
+
+import asyncio
+import heapq
+import logging
+import time
+import discord
+
+from typing import TYPE_CHECKING, Optional
+from bson import ObjectId
+
+from .models import InfractionType
+
+if TYPE_CHECKING:
+    from .bot import Bot
+
+EXPIRY_HORIZON = 3600 # seconds of upcoming expiries kept in memory
+EXPIRY_BATCH_SIZE = 100 # infractions marked expired per update
+RETRY_DELAY = 60 # seconds to wait after a failed batch
+MUTE_LIFT_GRACE = 3600 # seconds before the scheduler started in which expired mutes are still lifted
+
+# infractions whose expiry lifts the mute role
+MUTES = (InfractionType.mute.value, InfractionType.automute.value)
+
+logger = logging.getLogger(__name__)
+
+class ExpiryScheduler:
+    """Marks infractions as expired once their ``until`` has passed.
+
+    The deadlines within the next ``horizon`` seconds are kept in a min-heap and
+    the scheduler sleeps until the earliest one. The heap is refilled from the
+    database, with a query served by the ``{expired, until}`` index, whenever
+    the horizon is reached, so infractions expiring months from now are not held
+    in memory. Those which expired while the bot was offline are marked in
+    batches when it starts.
+    """
+
+    def __init__(self, bot: Bot, *, horizon: float = EXPIRY_HORIZON, batch_size: int = EXPIRY_BATCH_SIZE) -> None:
+        self.bot = bot
+        self.horizon = horizon
+        self.batch_size = batch_size
+        self._heap: list[tuple[float, ObjectId]] = [] # (until, infraction _id)
+        self._scheduled: set[ObjectId] = set()
+        self._loaded_until: float = 0 # every deadline up to this timestamp is in the heap
+        self._started: float = time.time()
+        self._wakeup = asyncio.Event()
+        self._task: Optional[asyncio.Task] = None
+
+    def __len__(self) -> int:
+        return len(self._heap)
+
+    def start(self) -> None:
+        if self._task is None or self._task.done():
+            self._task = asyncio.create_task(self._run())
+
+    def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def schedule(self, _id: ObjectId, until: Optional[float]) -> None:
+        """Schedules the expiry of a new infraction.
+
+        Deadlines beyond the horizon are left to the next refill.
+        """
+        if until is None or until > self._loaded_until or _id in self._scheduled:
+            return
+
+        self._push(until, _id)
+        if self._heap[0][1] == _id:
+            # the new deadline is the earliest, so the current sleep is too long
+            self._wakeup.set()
+
+    def _push(self, until: float, _id: ObjectId) -> None:
+        heapq.heappush(self._heap, (until, _id))
+        self._scheduled.add(_id)
+
+    async def _drain_overdue(self, now: float) -> int:
+        # the infractions which expired while nothing was scheduling them, possibly
+        # the whole history on the first start, are marked a batch at a time
+        # instead of being loaded into the heap
+        query = {'expired':{'$ne':True}, 'until':{'$lte':now}}
+        count = 0
+        while True:
+            documents = await self.bot.infractions.find(query, {'_id':1}, sort=[('until', 1)], limit=self.batch_size).to_list(length=None)
+            if not documents:
+                return count
+            count += await self.expire([d['_id'] for d in documents])
+
+    async def _load(self, now: float) -> None:
+        previous = self._loaded_until
+        if not previous:
+            count = await self._drain_overdue(now)
+            logger.info(f"Expired {count} overdue infractions")
+
+        # moved before querying so that infractions inserted meanwhile are scheduled
+        # by insert_infraction, duplicates are skipped through _scheduled
+        self._loaded_until = now + self.horizon
+
+        query = {'expired':{'$ne':True}, 'until':{'$gt':previous or now, '$lte':self._loaded_until}}
+
+        count = 0
+        try:
+            async for document in self.bot.infractions.find(query, {'until':1}):
+                if document['_id'] not in self._scheduled:
+                    self._push(document['until'], document['_id'])
+                    count += 1
+        except BaseException:
+            # reload the whole window on the next attempt, what was pushed is deduplicated
+            self._loaded_until = previous
+            raise
+
+        logger.debug(f"Scheduled the expiry of {count} infractions")
+
+    async def _run(self) -> None:
+        await self.bot.wait_until_ready()
+        self._started = time.time()
+        while True:
+            now = time.time()
+            due: list[tuple[float, ObjectId]] = []
+            try:
+                if now >= self._loaded_until:
+                    await self._load(now)
+
+                while self._heap and self._heap[0][0] <= now and len(due) < self.batch_size:
+                    due.append(heapq.heappop(self._heap))
+
+                if due:
+                    await self.expire([_id for _, _id in due])
+                    self._scheduled.difference_update(_id for _, _id in due)
+                    continue
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Could not expire the infractions")
+                for entry in due:
+                    heapq.heappush(self._heap, entry)
+                await asyncio.sleep(RETRY_DELAY)
+                continue
+
+            next_deadline = self._heap[0][0] if self._heap else self._loaded_until
+            timeout = min(next_deadline, self._loaded_until) - time.time()
+            self._wakeup.clear()
+            try:
+                await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0))
+            except asyncio.TimeoutError:
+                pass
+
+    async def expire(self, ids: list[ObjectId]) -> int:
+        """Marks infractions as expired.
+
+        The active infraction counts of the offenders are recounted and mutes
+        which expired while the scheduler was running have their mute role
+        removed. Older mutes are left alone, whoever has the role now may have
+        been muted by hand.
+
+        Parameters
+        ----------
+        ids : list[ObjectId]
+            The ``_id`` of the infractions.
+
+        Returns
+        -------
+        int
+            The number of infractions which expired.
+        """
+        projection = {'guild_id':1, 'offender':1, 'type':1, 'deleted':1, 'until':1}
+        documents = await self.bot.infractions.find({'_id':{'$in':ids}, 'expired':{'$ne':True}}, projection).to_list(length=None)
+        if not documents:
+            return 0
+
+        try:
+            await self.bot.infractions.update_many(
+                {'_id':{'$in':[d['_id'] for d in documents]}, 'expired':{'$ne':True}},
+                {'$set':{'expired':True}}
+            )
+        except Exception:
+            # some of them may have been marked already and the retry would skip
+            # those, so their offenders are counted again from the database and
+            # their mutes lifted now, which is safe since lift_mute only looks at
+            # the mutes still running
+            for document in documents:
+                self.bot.invalidate_active_infraction_count(document['guild_id'], document['offender'])
+                if not document.get('deleted', False) and self._should_lift(document):
+                    await self._lift_mute_logged(document)
+            raise
+
+        # nothing below may fail the batch, it has already been marked expired
+        for document in documents:
+            # invalidated rather than decremented, the infraction may have been
+            # removed since it was read, and remove_infraction decremented it then
+            self.bot.invalidate_active_infraction_count(document['guild_id'], document['offender'])
+            if document.get('deleted', False):
+                continue
+
+            if self._should_lift(document):
+                await self._lift_mute_logged(document)
+
+        return len(documents)
+
+    def _should_lift(self, document: dict) -> bool:
+        until = document.get('until')
+        return (
+            document['type'] in MUTES and
+            isinstance(until, (int, float)) and
+            until > self._started - MUTE_LIFT_GRACE
+        )
+
+    async def _lift_mute_logged(self, document: dict) -> None:
+        try:
+            await self.lift_mute(document['guild_id'], document['offender'])
+        except Exception:
+            logger.exception(f"Could not lift the mute of {document['offender']} in {document['guild_id']}")
+
+    async def lift_mute(self, guild_id: int, offender_id: int) -> None:
+        guild = self.bot.get_guild(guild_id)
+        if guild is None:
+            return
+
+        settings = await self.bot.get_guild_settings(guild_id)
+        role = guild.get_role(settings.mute_role) if settings.mute_role else None
+        if role is None:
+            return
+
+        # another mute may still be running
+        if await self.bot.infractions.count_documents({
+            'guild_id':guild_id,
+            'offender':offender_id,
+            'type':{'$in':MUTES},
+            'until':{'$gt':time.time()},
+            'deleted':False,
+            'expired':{'$ne':True}
+        }, limit=1):
+            return
+
+        member = guild.get_member(offender_id)
+        if member is None or role not in member.roles:
+            return
+
+        try:
+            await member.remove_roles(role, reason="Mute expired")
+        except discord.HTTPException as e:
+            logger.warning(f"Could not lift the mute of {offender_id} in {guild_id}: {e}")
@@ -0,0 +1,219 @@
+"""
+In-memory indexes used to look up tags
+Copyright (C) 2021-present ItsArtemiz (Augadh Verma)
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 3 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <https://www.gnu.org/licenses/>.
+"""
+
+import re
+
+from bisect import bisect_left, insort
+from collections import Counter
+from difflib import get_close_matches
+from typing import Iterable, Iterator, Literal
+
+SearchMode = Literal['fuzzy', 'prefix', 'substring', 'content']
+
+WORD_REGEX = re.compile(r'\w+')
+
+def trigrams(text: str, *, pad: bool = True) -> set[str]:
+    """The trigrams of a casefolded text.
+
+    Padding adds the trigrams at the start and end of the text, which makes
+    short texts and prefixes score higher. Unpadded trigrams are the ones any
+    superstring of the text is guaranteed to contain.
+    """
+    if pad:
+        text = f'  {text} '
+    return {text[i:i+3] for i in range(len(text) - 2)}
+
+def words(text: str | None) -> set[str]:
+    if not text:
+        return set()
+    return set(WORD_REGEX.findall(text.casefold()))
+
+class TagIndex:
+    """The names of a guild's tags, kept in memory.
+
+    The Tags cog keeps it up to date when tags are created, edited, deleted or
+    transferred so that misses and searches can be answered without querying
+    the database.
+
+    Names are indexed by their trigrams and the tag contents by their words,
+    so a search only looks at the tags sharing something with the query.
+    """
+    __slots__ = ('guild_id', '_owners', '_folded', '_sorted', '_grams', '_words', '_content_words')
+
+    def __init__(self, guild_id: int) -> None:
+        self.guild_id: int = guild_id
+        self._owners: dict[str, int] = {} # name -> owner id
+        self._folded: dict[str, str] = {} # name -> casefolded name
+        self._sorted: list[tuple[str, str]] = [] # (casefolded name, name), sorted for prefix lookups
+        self._grams: dict[str, set[str]] = {} # trigram -> names
+        self._words: dict[str, set[str]] = {} # content word -> names
+        self._content_words: dict[str, set[str]] = {} # name -> content words
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._owners
+
+    def __len__(self) -> int:
+        return len(self._owners)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._owners)
+
+    def add(self, name: str, owner: int, content: str | None = None) -> None:
+        """Adds a tag to the index, replacing the entry of the same name if any."""
+        if name in self._owners:
+            self.remove(name)
+
+        folded = name.casefold()
+        self._owners[name] = owner
+        self._folded[name] = folded
+        insort(self._sorted, (folded, name))
+        for gram in trigrams(folded):
+            self._grams.setdefault(gram, set()).add(name)
+
+        self.set_content(name, content)
+
+    def set_content(self, name: str, content: str | None) -> None:
+        for word in self._content_words.pop(name, ()):
+            names = self._words[word]
+            names.discard(name)
+            if not names:
+                del self._words[word]
+
+        content_words = words(content)
+        if content_words:
+            self._content_words[name] = content_words
+            for word in content_words:
+                self._words.setdefault(word, set()).add(name)
+
+    def remove(self, name: str) -> None:
+        if name not in self._owners:
+            return
+
+        del self._owners[name]
+        folded = self._folded.pop(name)
+        position = bisect_left(self._sorted, (folded, name))
+        del self._sorted[position]
+        for gram in trigrams(folded):
+            names = self._grams[gram]
+            names.discard(name)
+            if not names:
+                del self._grams[gram]
+
+        self.set_content(name, None)
+
+    def transfer(self, name: str, owner: int) -> None:
+        if name in self._owners:
+            self._owners[name] = owner
+
+    def owner(self, name: str) -> int | None:
+        return self._owners.get(name)
+
+    def close_matches(self, name: str, n: int = 3, cutoff: float = 0.6) -> list[str]:
+        # only run difflib over the names sharing a trigram with the query
+        candidates = self._trigram_candidates(trigrams(name.casefold()))
+        return get_close_matches(name, candidates.keys(), n=n, cutoff=cutoff)
+
+    def starting_with(self, prefix: str) -> Iterator[str]:
+        """The names starting with the prefix, case insensitively and in alphabetical order."""
+        prefix = prefix.casefold()
+        position = bisect_left(self._sorted, (prefix, ''))
+        for i in range(position, len(self._sorted)):
+            folded, name = self._sorted[i]
+            if not folded.startswith(prefix):
+                break
+            yield name
+
+    def containing(self, query: str) -> Iterator[str]:
+        """The names containing the query, case insensitively."""
+        query = query.casefold()
+        if len(query) < 3:
+            # too short to have a trigram of its own
+            return (name for name, folded in self._folded.items() if query in folded)
+
+        grams = sorted(trigrams(query, pad=False), key=lambda g: len(self._grams.get(g, ())))
+        candidates = set(self._grams.get(grams[0], ()))
+        for gram in grams[1:]:
+            if not candidates:
+                break
+            candidates.intersection_update(self._grams.get(gram, ()))
+        return (name for name in candidates if query in self._folded[name])
+
+    def _trigram_candidates(self, grams: Iterable[str]) -> Counter[str]:
+        shared: Counter[str] = Counter()
+        for gram in grams:
+            shared.update(self._grams.get(gram, ()))
+        return shared
+
+    def search(self, query: str, mode: SearchMode = 'fuzzy', *, limit: int = 100, cutoff: float = 0.3) -> list[tuple[str, float]]:
+        """Searches the tags.
+
+        Parameters
+        ----------
+        query : str
+            What to search for.
+        mode : SearchMode, optional
+            ``fuzzy`` ranks the names by trigram similarity with exact, prefix and
+            substring matches ranked first, ``prefix`` and ``substring`` only return
+            such matches and ``content`` searches the words of the tag contents,
+            by default 'fuzzy'
+        limit : int, optional
+            The maximum number of results, by default 100
+        cutoff : float, optional
+            The minimum fuzzy similarity, by default 0.3
+
+        Returns
+        -------
+        list[tuple[str, float]]
+            The names with their score between 0 and 1, best first.
+        """
+        folded = query.casefold()
+        results: dict[str, float] = {}
+
+        if mode == 'prefix':
+            for name in self.starting_with(folded):
+                results[name] = len(folded) / len(self._folded[name])
+
+        elif mode == 'substring':
+            for name in self.containing(folded):
+                results[name] = len(folded) / len(self._folded[name])
+
+        elif mode == 'content':
+            query_words = words(query)
+            if query_words:
+                shared: Counter[str] = Counter()
+                for word in query_words:
+                    shared.update(self._words.get(word, ()))
+                for name, count in shared.items():
+                    results[name] = count / len(query_words)
+
+        else:
+            query_grams = trigrams(folded)
+            for name, count in self._trigram_candidates(query_grams).items():
+                # jaccard similarity of the trigram sets, scaled below the direct matches
+                name_grams = len(trigrams(self._folded[name]))
+                score = 0.7 * count / (len(query_grams) + name_grams - count)
+                if score >= cutoff * 0.7:
+                    results[name] = score
+
+            for name in self.containing(folded):
+                results[name] = 0.8
+            for name in self.starting_with(folded):
+                results[name] = 1.0 if self._folded[name] == folded else 0.9
+
+        ranked = sorted(results.items(), key=lambda r: (-r[1], self._folded[r[0]]))
+        return ranked[:limit]